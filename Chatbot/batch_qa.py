@@ -0,0 +1,209 @@
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+from itertools import islice
+import numpy as np
+
+# Batch question answering: runs many independent queries or scripted conversations through a
+# profile with N conversations in flight, so vLLM's continuous batching has work to batch.
+# Usage:
+#   python batch_qa.py helpdesk_small_sample.csv --profile helpdesk --id-field issue_id \
+#       --query-field issue_body --reference-field answer_body --out answers.jsonl --concurrency 32
+#   python batch_qa.py questions.jsonl --profile medical --out answers.jsonl
+# JSONL input: one object per line with "id" and either "query" or "turns" (a scripted
+# conversation), optionally "profile". Results are appended to --out as each item finishes;
+# re-running the same command skips items already in the file (--retry-errors re-runs failures;
+# the last record per id wins).
+
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+# === Input ===
+def read_items(path, id_field="id", query_field="query", reference_field=None, clean=False):
+    # Yields {"id", "turns", "profile"?, "reference"?}; repeated ids (e.g. one CSV row per answer) are skipped
+    from ingest import clean_text
+
+    seen = set()
+    for number, record in enumerate(_records(path), 1):
+        item_id = str(record.get(id_field) or number)
+        if item_id in seen:
+            continue
+        seen.add(item_id)
+        turns = record.get("turns") or [record.get(query_field) or ""]
+        turns = [clean_text(turn) if clean else str(turn).strip() for turn in turns]
+        if not any(turns):
+            continue
+        item = {"id": item_id, "turns": [turn for turn in turns if turn]}
+        if record.get("profile"):
+            item["profile"] = record["profile"]
+        if reference_field and record.get(reference_field):
+            item["reference"] = record[reference_field]
+        yield item
+
+
+def _records(path):
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+# === Output (append-only JSONL, resumable) ===
+def completed_ids(path, retry_errors=False):
+    done = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut off by an interrupted run
+            done[record["id"]] = record["ok"]
+    return {item_id for item_id, ok in done.items() if ok or not retry_errors}
+
+
+def open_output(path):
+    # Appends; a partial last line from an interrupted run is terminated first
+    needs_newline = False
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    out = open(path, "a", encoding="utf-8")
+    if needs_newline:
+        out.write("\n")
+    return out
+
+
+# === Runner ===
+async def prefetch_embeddings(items):
+    # One burst of encodes for a chunk of items, so the batcher fills whole batches
+    from chat_engine import get_embedder
+
+    batcher, cache = get_embedder()
+    await asyncio.gather(*(cache.get_async(item["turns"][0], batcher.submit) for item in items))
+
+
+async def run_item(item, default_profile, run_id):
+    from chat_engine import get_engine
+    from timing import current_turn
+
+    engine = get_engine(item.get("profile", default_profile))
+    session_id = f"batch:{run_id}:{item['id']}"
+    record = {"id": item["id"], "profile": engine.profile.name, "turns": [], "ok": True, "started_at": time.time()}
+    if "reference" in item:
+        record["reference"] = item["reference"]
+    start = time.perf_counter()
+    try:
+        for query in item["turns"]:
+            reply = await engine.send_message_async(query, session_id)
+            turn = current_turn()  # the turn send_message_async just finished, in this task's context
+            record["turns"].append(dict(turn.as_dict(), query=query, reply=reply))
+            if turn.status not in ("ok", "cached"):
+                record["ok"] = False
+                break
+    except Exception as e:
+        record["ok"] = False
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        # Batch items never share or keep conversation state
+        engine.reset_conversation(session_id)
+        engine.sessions.discard(session_id)
+    record["elapsed"] = time.perf_counter() - start
+    return record
+
+
+async def run_batch(items, out, default_profile, concurrency, chunk_size, progress_every=50):
+    run_id = f"{os.getpid()}-{int(time.time())}"
+    slots = asyncio.Semaphore(concurrency)
+    pending, totals = set(), []
+
+    async def worker(item):
+        try:
+            record = await run_item(item, default_profile, run_id)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            totals.append((record["ok"], record["elapsed"]))
+            if len(totals) % progress_every == 0:
+                print(f"… {len(totals)} items done", file=sys.stderr)
+        finally:
+            slots.release()
+
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        prefetch = asyncio.create_task(prefetch_embeddings(chunk))
+        for item in chunk:
+            await slots.acquire()
+            task = asyncio.create_task(worker(item))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await prefetch
+    if pending:
+        await asyncio.gather(*pending)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV of queries or scripted conversations in parallel.")
+    parser.add_argument("input", help="JSONL (id, query | turns, profile?) or CSV file")
+    parser.add_argument("--profile", default="helpdesk", help="Profile for items without a 'profile' field")
+    parser.add_argument("--out", required=True, help="JSONL results file (appended to; re-runs resume)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversations (and generations) in flight")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Items whose queries are embedded together")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--query-field", default="query")
+    parser.add_argument("--reference-field", help="Copied into each result, e.g. answer_body for regression checks")
+    parser.add_argument("--clean", action="store_true", help="Apply ingest.py's text cleaning to queries")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run items whose last result failed")
+    parser.add_argument("--limit", type=int, help="Stop after this many new items")
+    args = parser.parse_args(argv)
+
+    # The scheduler and connection pool must admit every conversation in flight; set before the engine loads
+    os.environ["INFER_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ["INFER_MAX_QUEUE"] = str(max(args.concurrency, int(os.environ.get("INFER_MAX_QUEUE", "64"))))
+    os.environ["INFER_POOL_MAXSIZE"] = str(max(args.concurrency, int(os.environ.get("INFER_POOL_MAXSIZE", "32"))))
+
+    from transport import run_sync, close_async_clients
+    from startup import warm_up
+
+    done = completed_ids(args.out, args.retry_errors)
+    items = (item for item in read_items(args.input, args.id_field, args.query_field, args.reference_field, args.clean)
+             if item["id"] not in done)
+    if args.limit:
+        items = islice(items, args.limit)
+    if done:
+        print(f"↩️ Resuming: {len(done)} items already in {args.out}", file=sys.stderr)
+
+    warm_up([args.profile])
+    start = time.perf_counter()
+    with open_output(args.out) as out:
+        try:
+            totals = run_sync(run_batch(items, out, args.profile, args.concurrency, args.chunk_size))
+        finally:
+            run_sync(close_async_clients())
+    wall = time.perf_counter() - start
+
+    if not totals:
+        print("Nothing to do.")
+        return 0
+    elapsed = np.asarray([seconds for _, seconds in totals]) * 1000
+    failed = sum(1 for ok, _ in totals if not ok)
+    print(f"{len(totals)} items ({failed} failed) in {wall:.1f}s → {len(totals) / wall:.2f} items/s; "
+          f"per item p50 {np.percentile(elapsed, 50):.0f} ms, p95 {np.percentile(elapsed, 95):.0f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
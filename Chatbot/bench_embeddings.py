@@ -0,0 +1,117 @@
+import sys
+import time
+import json
+import argparse
+from itertools import islice
+import numpy as np
+from embedding_backends import BACKENDS, load_embedding_model
+from ingest import iter_helpdesk_documents, iter_medical_documents
+
+# Usage:
+#   python embedding_backends.py export          # once, builds onnx_model/
+#   python bench_embeddings.py --backends torch onnx onnx-int8
+# Reports encode latency/throughput per batch size, and parity against the torch backend:
+# per-text cosine plus how many decisions flip at the 0.4 retrieval and 0.5 drift thresholds.
+
+RETRIEVAL_THRESHOLD = 0.4  # on the ES score, (1 + cos) / 2
+DRIFT_THRESHOLD = 0.5      # on the raw cosine between queries
+
+
+def sample_texts(limit):
+    # Documents from both bundled corpora; queries are their opening sentences (short, like user turns).
+    documents = [text for _, _, text in islice(iter_helpdesk_documents("helpdesk_small_sample.csv"), limit)]
+    documents += [text for _, _, text in islice(iter_medical_documents("parsed_medical_chunks.jsonl"), limit)]
+    queries = [" ".join(text.split()[:20]) for text in documents]
+    return documents, queries
+
+
+def time_encode(model, texts, batch_size, repeats):
+    batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    model.encode(batch, batch_size=batch_size)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.encode(batch, batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+    p50 = float(np.median(timings))
+    return {"batch_size": batch_size, "p50_ms": p50 * 1000, "texts_per_s": batch_size / p50}
+
+
+def flips(reference, candidate, threshold):
+    return int(np.count_nonzero((reference >= threshold) != (candidate >= threshold)))
+
+
+def parity(reference, candidate):
+    # reference/candidate: dicts of "documents"/"queries" -> normalized matrices from the two backends
+    per_text = np.concatenate([
+        np.sum(reference[k] * candidate[k], axis=1) for k in ("documents", "queries")
+    ])
+    ref_scores = (1 + reference["queries"] @ reference["documents"].T) / 2
+    new_scores = (1 + candidate["queries"] @ candidate["documents"].T) / 2
+    ref_drift = reference["queries"] @ reference["queries"].T
+    new_drift = candidate["queries"] @ candidate["queries"].T
+    ref_top = np.argsort(-ref_scores, axis=1)[:, :3]
+    new_top = np.argsort(-new_scores, axis=1)[:, :3]
+    return {
+        "cosine_mean": float(per_text.mean()),
+        "cosine_min": float(per_text.min()),
+        "retrieval_flips": flips(ref_scores, new_scores, RETRIEVAL_THRESHOLD),
+        "retrieval_pairs": int(ref_scores.size),
+        "drift_flips": flips(ref_drift, new_drift, DRIFT_THRESHOLD),
+        "drift_pairs": int(ref_drift.size),
+        "top3_overlap": float(np.mean([len(set(a) & set(b)) / 3 for a, b in zip(ref_top, new_top)])),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and parity-check the embedding backends.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32, 128])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=200, help="Documents per corpus used for parity")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    documents, queries = sample_texts(args.limit)
+    results, vectors = {}, {}
+    for backend in args.backends:
+        start = time.perf_counter()
+        model = load_embedding_model(backend, fallback=False)  # measure the backend asked for, or fail
+        load_s = time.perf_counter() - start
+        vectors[backend] = {
+            "documents": np.asarray(model.encode(documents, batch_size=32), dtype=np.float32),
+            "queries": np.asarray(model.encode(queries, batch_size=32), dtype=np.float32),
+        }
+        results[backend] = {
+            "load_s": load_s,
+            "latency": [time_encode(model, queries, size, args.repeats) for size in args.batch_sizes],
+        }
+
+    reference = "torch" if "torch" in vectors else None
+    print(f"{len(documents)} documents, {len(queries)} queries\n")
+    print(f"{'backend':<10} {'load s':>7} " + " ".join(f"{'bs=' + str(s) + ' ms':>11} {'txt/s':>8}" for s in args.batch_sizes))
+    for backend, result in results.items():
+        cells = " ".join(f"{r['p50_ms']:>11.2f} {r['texts_per_s']:>8.0f}" for r in result["latency"])
+        print(f"{backend:<10} {result['load_s']:>7.2f} {cells}")
+
+    if reference:
+        print(f"\nParity vs {reference}:")
+        for backend in results:
+            if backend == reference:
+                continue
+            p = results[backend]["parity"] = parity(vectors[reference], vectors[backend])
+            print(f"  {backend:<10} cos mean {p['cosine_mean']:.5f} min {p['cosine_min']:.5f} | "
+                  f"retrieval flips @{RETRIEVAL_THRESHOLD} {p['retrieval_flips']}/{p['retrieval_pairs']} | "
+                  f"drift flips @{DRIFT_THRESHOLD} {p['drift_flips']}/{p['drift_pairs']} | "
+                  f"top-3 overlap {p['top3_overlap']:.3f}")
+    else:
+        print("\n(parity skipped: include the torch backend as the reference)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from fake_vllm import FakeChatServer
+
+# Offline end-to-end benchmark: a fake vLLM server and an in-process kNN index built from the
+# bundled samples stand in for the inference server and the ES cluster.
+# Usage:
+#   python bench_pipeline.py --profiles helpdesk medical --conversations 64 --concurrency 8 --stream
+# Reports p50/p95/p99 per stage (encode, retrieve, pack, prompt, queue, inference) and overall throughput.
+
+# Scripted multi-turn conversations per profile (vague openers, follow-ups and a topic change)
+SCRIPTS = {
+    "helpdesk": [
+        ["My build is failing", "npm install fails with a module not found error on a clean checkout",
+         "idk", "It started after upgrading node to the latest version yesterday",
+         "Separately, the Serial Monitor in the Arduino IDE freezes when I open it"],
+        ["Serial Monitor freezing issue with my Arduino IDE, what could be the problem?",
+         "It happens on Windows 11 with the 2.x IDE", "not sure which board package version",
+         "Would reinstalling the board package help?"],
+    ],
+    "medical": [
+        ["I have a symptom", "Persistent headache for two weeks with occasional blurred vision",
+         "not sure", "Which tests would usually be ordered for this presentation?",
+         "On a different topic, what are typical treatments for a mild asthma exacerbation?"],
+        ["What does an elevated white blood cell count usually indicate in a routine report?",
+         "The patient also has a low grade fever", "idk",
+         "What follow-up would be reasonable?"],
+    ],
+}
+STAGE_ORDER = ("encode", "retrieve", "pack", "prompt", "queue", "inference", "ttft", "total")
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64) * 1000
+    return {"count": int(values.size), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)), "p99": float(np.percentile(values, 99))}
+
+
+def build_indexes(profiles, engines):
+    # Embeds the bundled samples into LOCAL_INDEX_ROOT with the engine's own embedding model
+    from ingest import CORPORA, ingest_local
+    from chat_engine import get_embedding_model
+
+    model = get_embedding_model()
+    for name in profiles:
+        corpus = CORPORA[name]
+        stats = {"embedded": 0, "unchanged": 0, "removed": 0, "errors": 0}
+        start = time.perf_counter()
+        ingest_local(engines[name].profile.index, corpus["reader"](corpus["source"]), model, 64, False, stats)
+        print(f"📚 {name}: {stats['embedded']} embedded, {stats['unchanged']} unchanged "
+              f"({time.perf_counter() - start:.1f}s)")
+
+
+def run_conversation(engine, session_id, script, stream, suffix):
+    for text in script:
+        query = f"{text} {suffix}" if suffix else text
+        if stream:
+            for _ in engine.send_message_stream(query, session_id):
+                pass
+        else:
+            engine.send_message(query, session_id)
+
+
+def report(turns, wall, file=sys.stdout):
+    samples = {name: [] for name in STAGE_ORDER}
+    statuses = {}
+    for turn in turns:
+        statuses[turn["status"]] = statuses.get(turn["status"], 0) + 1
+        for name, seconds in turn["stages"].items():
+            samples[name].append(seconds)
+        if turn["ttft"] is not None:
+            samples["ttft"].append(turn["ttft"])
+        samples["total"].append(turn["total"])
+
+    results = {"turns": len(turns), "statuses": statuses, "wall_s": wall,
+               "turns_per_s": len(turns) / wall if wall else 0.0, "stages": {}}
+    print(f"\n{'stage':<10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=file)
+    for name in STAGE_ORDER:
+        if samples[name]:
+            p = results["stages"][name] = percentiles(samples[name])
+            print(f"{name:<10} {p['count']:>6} {p['p50']:>9.1f} {p['p95']:>9.1f} {p['p99']:>9.1f}", file=file)
+    status_text = ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
+    print(f"\n{len(turns)} turns ({status_text}) in {wall:.2f}s → {results['turns_per_s']:.1f} turns/s", file=file)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark for the chat pipeline.")
+    parser.add_argument("--profiles", nargs="+", default=sorted(SCRIPTS), choices=sorted(SCRIPTS))
+    parser.add_argument("--conversations", type=int, default=32, help="Conversations per profile")
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversations in flight at once")
+    parser.add_argument("--stream", action="store_true", help="Use send_message_stream instead of send_message")
+    parser.add_argument("--ttft-ms", type=float, default=100.0)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--reply-tokens", type=int, default=64)
+    parser.add_argument("--slots", type=int, default=0, help="Fake server generation slots (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake inference requests failing with 503")
+    parser.add_argument("--index-root", help="Reuse this local index directory (default: a temp dir)")
+    parser.add_argument("--repeat-queries", action="store_true",
+                        help="Send identical text in every conversation (lets the embedding cache absorb encodes)")
+    parser.add_argument("--script", help="JSON file of {profile: [[turn, ...], ...]} replacing the built-in scripts")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    server = FakeChatServer(ttft_ms=args.ttft_ms, token_ms=args.token_ms, reply_tokens=args.reply_tokens,
+                            slots=args.slots, error_rate=args.error_rate)
+    server.start()
+
+    # Stand-ins must be configured before the engine modules read their settings
+    os.environ["RETRIEVAL_BACKEND"] = "local"
+    os.environ["LOCAL_INDEX_ROOT"] = args.index_root or tempfile.mkdtemp(prefix="bench-index-")
+    for name in args.profiles:
+        os.environ[f"{name.upper()}_INFER_URL"] = server.url
+
+    import chat_engine
+    import timing
+    from transport import run_sync, close_async_clients
+    from startup import warm_up
+
+    scripts = SCRIPTS
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            scripts = json.load(f)
+
+    engines = {name: chat_engine.get_engine(name) for name in args.profiles}
+    build_indexes(args.profiles, engines)
+    warm_up(args.profiles)
+
+    turns, turns_lock = [], threading.Lock()
+
+    def collect(turn):
+        with turns_lock:
+            turns.append(turn.as_dict())
+
+    jobs = []
+    for name in args.profiles:
+        for i in range(args.conversations):
+            script = scripts[name][i % len(scripts[name])]
+            jobs.append((engines[name], f"bench-{name}-{i}", script, "" if args.repeat_queries else f"(case {i})"))
+
+    timing.add_listener(collect)
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(run_conversation, engine, sid, script, args.stream, suffix)
+                           for engine, sid, script, suffix in jobs]:
+                future.result()
+    finally:
+        wall = time.perf_counter() - start
+        timing.remove_listener(collect)
+        run_sync(close_async_clients())
+        server.stop()
+
+    print(f"\n{len(jobs)} conversations, concurrency {args.concurrency}, "
+          f"{'streaming' if args.stream else 'non-streaming'}, fake vLLM ttft {args.ttft_ms:.0f} ms + "
+          f"{args.token_ms:.0f} ms/token × {args.reply_tokens}")
+    results = report(turns, wall)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(dict(results, args=vars(args)), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import os
+import uuid
+import streamlit as st
+from itertools import chain
+from startup import start_warm_up, is_ready
+
+# --- One page for every assistant: the profiles share this process's engine, embedding model and pools
+#     (test_streamlit.py / medical_streamlit.py each serve a single profile)
+APP_PROFILES = [name for name in os.environ.get("CHAT_APP_PROFILES", "").split(",") if name]  # empty = all
+# --- Only the latest messages are drawn as chat bubbles; earlier ones stay collapsed (0 = draw all)
+HISTORY_WINDOW = int(os.environ.get("CHAT_HISTORY_WINDOW", "20"))
+
+# --- Hide Streamlit default elements
+hide_streamlit_style = """
+    <style>
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+    header {visibility: hidden;}
+    .stDeployButton {visibility: hidden;}
+    </style>
+"""
+st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+
+# --- Avatar URLs
+USER_AVATAR = "https://cdn-icons-png.flaticon.com/512/847/847969.png"
+ASSISTANT_AVATAR = "https://github.githubassets.com/images/modules/logos_page/GitHub-Mark.png"
+
+
+# --- Backend resources (engines, embedding model, connection pools) are built once per process, not per rerun
+@st.cache_resource(show_spinner=False)
+def load_engines():
+    import chat_engine  # 🧠 shared chat engine, one per profile
+
+    names = APP_PROFILES or sorted(chat_engine.get_profiles())
+    start_warm_up(names)  # loads the embedding model in the background while the page renders
+    return {name: chat_engine.get_engine(name) for name in names}
+
+
+engines = load_engines()
+
+# --- Assistant picker; `?profile=medical` preselects one. Each assistant keeps its own conversation
+names = list(engines)
+requested = st.query_params.get("profile")
+profile = st.radio(
+    "Assistant", names, index=names.index(requested) if requested in names else 0, horizontal=True,
+    format_func=lambda name: engines[name].profile.title, label_visibility="collapsed",
+)
+st.query_params["profile"] = profile
+engine = engines[profile]
+
+# --- Page Title
+st.markdown(
+    f"""
+    <h1 style="text-align: center;">
+        {engine.profile.title}
+    </h1>
+    """,
+    unsafe_allow_html=True
+)
+
+# --- Backend conversation ids live in the server-side session only, never in the URL: this page can
+#     serve clinical conversations (see RESUME_FROM_URL in the Readme). A reload starts fresh ones
+if "conversations" not in st.session_state:
+    st.session_state.conversations = {}
+if profile not in st.session_state.conversations:
+    st.session_state.conversations[profile] = {
+        "id": uuid.uuid4().hex,  # 🔄 New id = fresh backend context
+        "messages": [{"role": "assistant", "content": "👋 Hi there! How may I help you today?"}],
+    }
+session_id = st.session_state.conversations[profile]["id"]
+messages = st.session_state.conversations[profile]["messages"]
+
+
+def render_earlier(messages):
+    # One markdown element for the whole collapsed part instead of a chat bubble per message
+    return "\n\n---\n\n".join(
+        f"**{'You' if msg['role'] == 'user' else 'Assistant'}:** {msg['content']}" for msg in messages
+    )
+
+
+# --- Display chat history: every rerun redraws it, so only a window of it is sent to the browser
+hidden = len(messages) - HISTORY_WINDOW if HISTORY_WINDOW and len(messages) > HISTORY_WINDOW else 0
+chat_container = st.container()
+with chat_container:
+    if hidden and st.toggle("Show earlier messages", key=f"show_earlier_{profile}", help=f"{hidden} earlier messages"):
+        with st.container(border=True):
+            st.markdown(render_earlier(messages[:hidden]))
+    for msg in messages[hidden:]:
+        avatar = USER_AVATAR if msg["role"] == "user" else ASSISTANT_AVATAR
+        with st.chat_message(msg["role"], avatar=avatar):
+            st.markdown(msg["content"])
+
+# --- Input field
+prompt = st.chat_input("Type your question here...")
+
+# --- On user input
+if prompt:
+    # Show user message
+    with chat_container:
+        with st.chat_message("user", avatar=USER_AVATAR):
+            st.markdown(prompt)
+    messages.append({"role": "user", "content": prompt})
+
+    # Call the selected assistant's engine
+    with chat_container:
+        with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
+            try:
+                # Spinner covers retrieval + time-to-first-token, then tokens render as they arrive
+                stream = engine.send_message_stream(prompt, session_id)
+                with st.spinner("Thinking..." if is_ready() else "Loading the assistant..."):
+                    first_chunk = next(stream, "")
+                # One element, updated in place as tokens arrive
+                response_text = st.write_stream(chain([first_chunk], stream))
+                messages.append({"role": "assistant", "content": response_text})
+            except Exception as e:
+                st.error(f"Error calling backend: {e}")
@@ -0,0 +1,540 @@
+import os
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+import numpy as np
+from transport import get_es_client, get_async_es_client, post_chat_completion_async, stream_chat_completion_async, InferenceError, run_sync, iterate_sync
+from conversation import Conversation, SessionStore, DEFAULT_SESSION
+from state_store import get_state_store
+from embeddings import EmbeddingCache, EmbeddingBatcher
+from local_index import RETRIEVAL_BACKEND, EMBEDDINGS_FILE, get_local_index, local_index_path
+from semantic_cache import response_cache
+from history import trim_to_budget, prompt_budget, prompt_tokens
+from prompt_layout import stable_layout, is_context_message, pin_context, trim_stable, assemble_prompt, measure_prefix_reuse
+from profiles import load_profiles
+from embedding_backends import EMBEDDING_BACKEND, load_embedding_model
+from timing import begin_turn, end_turn, stage, annotate
+from resilience import (ENCODE_DEADLINE, RETRIEVE_DEADLINE, RETRIEVE_RETRIES, RETRIEVE_HEDGE_MS, INFER_DEADLINE,
+                        INFER_FIRST_TOKEN_DEADLINE, LOCAL_FALLBACK, call_with_retries, first_item_deadline,
+                        get_breaker, breaker_stats)
+from scheduler import SchedulerBusy, get_scheduler, scheduler_stats
+from context_packing import (CONTEXT_PACKING, CONTEXT_TOKEN_BUDGET, CONTEXT_CANDIDATES, PASSAGE_CACHE_SIZE,
+                             plan_passages, mmr_select, pack_matches)
+
+EMBEDDING_MODEL = "multi-qa-MiniLM-L6-cos-v1"
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+TIMEOUT_REPLY = "⚠️ The assistant is taking too long to respond. Please try again in a moment."
+BUSY_REPLY = "⚠️ The assistant is busy right now. Please try again in a few seconds."
+
+# === Process-wide embedding model (shared by every profile) ===
+_embedder_lock = threading.Lock()
+_model = None
+_embedding_batcher = None
+_embedding_cache = None
+_passage_cache = None
+
+
+def get_embedder():
+    # Loaded once per process: one model, one batching worker, one query cache for all assistants
+    global _model, _embedding_batcher, _embedding_cache
+    if _embedding_cache is not None:
+        return _embedding_batcher, _embedding_cache
+    with _embedder_lock:
+        if _embedding_cache is None:
+            _model = load_embedding_model(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+            _embedding_batcher = EmbeddingBatcher(_model.encode)  # concurrent sessions share batched encodes
+            _embedding_cache = EmbeddingCache(_embedding_batcher.encode)
+    return _embedding_batcher, _embedding_cache
+
+
+def get_passage_cache():
+    # Retrieved passages get their own LRU so they don't evict cached queries
+    global _passage_cache
+    batcher, _ = get_embedder()
+    with _embedder_lock:
+        if _passage_cache is None:
+            _passage_cache = EmbeddingCache(batcher.encode, max_entries=PASSAGE_CACHE_SIZE)
+    return _passage_cache
+
+
+def get_embedding_model():
+    get_embedder()
+    return _model
+
+
+def calculate_similarity(embedding1, embedding2):
+    # Every backend returns L2-normalized vectors, so the dot product is the cosine similarity
+    return float(np.dot(embedding1, embedding2))
+
+
+def knn_query(query_embedding, top_n):
+    return {
+        "size": top_n,
+        "query": {
+            "knn": {
+                "field": "embedding",
+                "k": top_n,
+                "num_candidates": 100,
+                "query_vector": query_embedding.tolist()
+            }
+        }
+    }
+
+
+# === Chat engine (one per domain profile) ===
+class ChatEngine:
+    def __init__(self, profile):
+        self.profile = profile
+        self.sessions = SessionStore(self.new_conversation, backend=get_state_store(), namespace=profile.name)
+
+    # --- Per-session state ---
+    def new_conversation(self):
+        return Conversation(self.profile.system_prompt)
+
+    def reset_conversation(self, session_id=DEFAULT_SESSION):
+        self.sessions.reset(session_id)
+
+    # --- Embeddings ---
+    def get_embedding(self, text):
+        return get_embedder()[1].get(text)
+
+    async def get_embedding_async(self, text):
+        batcher, cache = get_embedder()
+        return await cache.get_async(text, batcher.submit)
+
+    # --- RAG retrieval (Elasticsearch or local index) ---
+    def format_matches(self, hits):
+        matches = [self.profile.format_match(hit) for hit in hits if hit["_score"] >= self.profile.min_score]
+        annotate(retrieval={
+            "hits": len(hits),
+            "matches": len(matches),
+            "top_score": max((hit["_score"] for hit in hits), default=None),
+        })
+        return matches
+
+    def es_breaker(self):
+        return get_breaker(f"elasticsearch:{self.profile.es_host}")
+
+    def fallback_hits(self, query_embedding, top_n, reason):
+        # ES is unhealthy: search a local snapshot of the index if there is one, otherwise
+        # continue without context (the profile's "no matches" message)
+        path = local_index_path(self.profile.index)
+        if LOCAL_FALLBACK and os.path.exists(os.path.join(path, EMBEDDINGS_FILE)):
+            annotate(retrieval_fallback=f"local:{reason}")
+            return get_local_index(self.profile.index).search(query_embedding, top_n)
+        annotate(retrieval_fallback=f"none:{reason}")
+        return []
+
+    def retrieve_most_relevant_embeddings(self, user_query, top_n=3, query_embedding=None):
+        # Callers that already encoded the query pass it in to avoid a second encode
+        if query_embedding is None:
+            query_embedding = self.get_embedding(user_query)
+
+        with stage("retrieve"):
+            candidates = max(top_n, CONTEXT_CANDIDATES) if CONTEXT_PACKING else top_n
+            if RETRIEVAL_BACKEND == "local":
+                hits = get_local_index(self.profile.index).search(query_embedding, candidates)
+            else:
+                hits = self.search_es(query_embedding, candidates)
+        matches = self.format_matches(hits)
+        if not CONTEXT_PACKING or not matches:
+            return matches
+        with stage("pack"):
+            passages = plan_passages(matches, self.profile.match_text_key)
+            batcher, _ = get_embedder()
+            embeddings = get_passage_cache().get_many([p.text for p in passages], batcher.submit)
+            return self.pack_context(query_embedding, matches, passages, embeddings)
+
+    def pack_context(self, query_embedding, matches, passages, embeddings):
+        # Dedup + MMR over the passages of every match, capped at CONTEXT_TOKEN_BUDGET tokens
+        token_counts = [p.tokens for p in passages]
+        selected = mmr_select(query_embedding, embeddings, token_counts, CONTEXT_TOKEN_BUDGET)
+        packed = pack_matches(matches, self.profile.match_text_key, passages, selected)
+        annotate(packing={
+            "matches": len(matches),
+            "passages": len(passages),
+            "selected": len(selected),
+            "tokens_before": sum(token_counts),
+            "tokens_after": sum(token_counts[i] for i in selected),
+        })
+        return packed
+
+    def search_es(self, query_embedding, top_n):
+        breaker = self.es_breaker()
+        if not breaker.allow():
+            return self.fallback_hits(query_embedding, top_n, "breaker_open")
+        es = get_es_client(self.profile.es_host).options(request_timeout=RETRIEVE_DEADLINE, max_retries=0)  # retries would outlast the deadline
+        try:
+            response = es.search(index=self.profile.index, body=knn_query(query_embedding, top_n))
+        except Exception:
+            breaker.record_failure()
+            return self.fallback_hits(query_embedding, top_n, "error")
+        breaker.record_success()
+        return response["hits"]["hits"]
+
+    async def retrieve_most_relevant_embeddings_async(self, user_query, top_n=3, query_embedding=None):
+        if query_embedding is None:
+            query_embedding = await self.get_embedding_async(user_query)
+
+        with stage("retrieve"):
+            candidates = max(top_n, CONTEXT_CANDIDATES) if CONTEXT_PACKING else top_n
+            if RETRIEVAL_BACKEND == "local":
+                hits = get_local_index(self.profile.index).search(query_embedding, candidates)
+            else:
+                hits = await self.search_es_async(query_embedding, candidates)
+        matches = self.format_matches(hits)
+        if not CONTEXT_PACKING or not matches:
+            return matches
+        with stage("pack"):
+            passages = plan_passages(matches, self.profile.match_text_key)
+            batcher, _ = get_embedder()
+            cache = get_passage_cache()
+            embeddings = await asyncio.gather(*(cache.get_async(p.text, batcher.submit) for p in passages))
+            return self.pack_context(query_embedding, matches, passages, embeddings)
+
+    async def search_es_async(self, query_embedding, top_n):
+        # Searches are idempotent: bounded retries with jittered backoff (and optionally a hedged
+        # second request) inside one deadline. The client's own retries are off so they don't stack.
+        breaker = self.es_breaker()
+        if not breaker.allow():
+            return self.fallback_hits(query_embedding, top_n, "breaker_open")
+        es = get_async_es_client(self.profile.es_host)
+        body = knn_query(query_embedding, top_n)
+
+        async def attempt(timeout):
+            response = await es.options(request_timeout=timeout, max_retries=0).search(index=self.profile.index, body=body)
+            return response["hits"]["hits"]
+
+        try:
+            hits = await call_with_retries(attempt, RETRIEVE_DEADLINE, RETRIEVE_RETRIES, RETRIEVE_HEDGE_MS / 1000)
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            return self.fallback_hits(query_embedding, top_n, "timeout")
+        except Exception:
+            breaker.record_failure()
+            return self.fallback_hits(query_embedding, top_n, "error")
+        breaker.record_success()
+        return hits
+
+    # --- Topic drift ---
+    def topic_similarity(self, conv, user_query, user_embedding):
+        # None when there is no topic yet or the query is too short to judge drift
+        if conv.initial_topic_embedding is None or len(user_query.split()) <= 5:
+            return None
+        return calculate_similarity(conv.initial_topic_embedding, user_embedding)
+
+    # --- History management ---
+    def remove_old_context_messages(self, conv):
+        conv.messages = [msg for msg in conv.messages if not is_context_message(msg)]
+
+    def trim_history(self, conv, tail=()):
+        # Token-budgeted window: oldest turns go first, the current retrieved context is pinned
+        pinned = [msg for msg in conv.messages if is_context_message(msg)][-1:]
+        budget = prompt_budget(self.profile.max_tokens)
+        if stable_layout():
+            conv.messages = trim_stable(conv.messages, budget, pinned=pinned, tail=tail)
+        else:
+            conv.messages = trim_to_budget(conv.messages, budget, pinned=pinned)
+
+    # --- Prompt assembly ---
+    def context_message(self, top_matches):
+        if top_matches:
+            context = self.profile.format_context(top_matches).replace('\n', '\n> ')
+            content = self.profile.context_found.format(context=context)
+        else:
+            content = self.profile.context_missing
+        return {"role": "user", "content": content}
+
+    def response_behavior(self, conv, user_query):
+        # guiding questions -> one follow-up -> general causes, for vague or very short queries
+        vague = any(keyword in user_query.lower() for keyword in self.profile.vague_keywords)
+        if not vague and len(user_query.split()) > 4:
+            return "normal"
+        if not conv.guiding_questions_done:
+            conv.guiding_questions_done = True
+            return "guiding_questions"
+        conv.clarification_rounds += 1
+        return "general_causes" if conv.clarification_rounds >= 2 else "follow_up_question"
+
+    def build_payload(self, conv, user_query, stream=False, user_embedding=None, top_matches=None):
+        # The async pipeline passes in the embedding and (when needed) prefetched matches
+        if user_embedding is None:
+            user_embedding = self.get_embedding(user_query)
+
+        similarity = self.topic_similarity(conv, user_query, user_embedding)
+        if conv.initial_topic_embedding is None:
+            conv.initial_topic_embedding = user_embedding
+        elif similarity is not None and similarity < 0.5:
+            if self.profile.announce_topic_change:
+                print(f"🔄 Major topic change detected (similarity {similarity:.2f}). Resetting context.")
+            annotate(topic_reset=True)
+            conv.context_injected = False
+            conv.initial_topic_embedding = user_embedding
+            conv.guiding_questions_done = False
+            conv.clarification_rounds = 0
+            if self.profile.drop_stale_context and not stable_layout():
+                self.remove_old_context_messages(conv)
+
+        if not conv.context_injected:
+            if top_matches is None:
+                top_matches = self.retrieve_most_relevant_embeddings(user_query, query_embedding=user_embedding)
+            context_msg = self.context_message(top_matches)
+            if stable_layout():
+                pin_context(conv.messages, context_msg)
+            else:
+                conv.messages.append(context_msg)
+            conv.context_injected = True
+
+        instruction = self.profile.instructions.get(self.response_behavior(conv, user_query))
+        # Stable layout keeps the instruction out of history and sends it after the query,
+        # so the history prefix stays identical from one turn to the next
+        tail = []
+        if instruction:
+            behavior_instruction = {"role": "user", "content": instruction}
+            if stable_layout():
+                tail.append(behavior_instruction)
+            else:
+                conv.messages.append(behavior_instruction)
+
+        conv.messages.append({"role": "user", "content": user_query})
+        self.trim_history(conv, tail)
+
+        # Inference request (a fresh list, so later turns can't mutate it in flight)
+        prompt = assemble_prompt(conv.messages, tail)
+        annotate(prefix_reuse=measure_prefix_reuse(conv, prompt)["ratio"])
+        payload = {
+            "model": "model",
+            "messages": prompt,
+            "max_tokens": self.profile.max_tokens,
+            "temperature": 0.3,
+            "top_p": 1,
+            "repetition_penalty": 1.1,
+            "presence_penalty": 0.2,
+            "frequency_penalty": 0.2,
+        }
+        payload.update(self.profile.payload)
+        payload["stream"] = stream
+        if stream:
+            payload["stream_options"] = {"include_usage": True}  # token usage arrives in the last chunk
+        return payload
+
+    def record_reply(self, conv, user_query, reply):
+        reply = reply.strip()
+        if len(reply.split()) > 300:
+            reply += "\n\nWould you like me to continue?"
+        conv.messages.append({"role": "assistant", "content": reply})
+        conv.add_to_transcript(user_query, reply)
+        conv.pending = None
+
+        self.trim_history(conv)
+        conv.enforce_memory_cap()
+        self.sessions.save(conv)
+        return reply
+
+    def transcript(self, session_id=DEFAULT_SESSION):
+        # User/assistant turns for redisplay (e.g. a reloaded page on another replica), as the user
+        # saw them: kept apart from `messages`, which is trimmed to the token budget
+        conv = self.sessions.get(session_id)
+        with conv.lock:
+            return [dict(msg) for msg in conv.transcript]
+
+    # --- Async pipeline ---
+    async def prepare_turn_async(self, conv, user_query, stream=False):
+        with stage("encode"):
+            user_embedding = await asyncio.wait_for(self.get_embedding_async(user_query), ENCODE_DEADLINE)
+
+        # Retrieval is only needed without context or on a topic change; drift is one dot product
+        # on the embedding we already have, so it is checked before any search starts
+        top_matches = None
+        similarity = self.topic_similarity(conv, user_query, user_embedding)
+        if not conv.context_injected or (similarity is not None and similarity < 0.5):
+            top_matches = await self.retrieve_most_relevant_embeddings_async(user_query, query_embedding=user_embedding)
+
+        with stage("prompt"), conv.lock:
+            first_turn = len(conv.messages) == 1
+            conv.pending = conv.checkpoint()
+            payload = self.build_payload(conv, user_query, stream, user_embedding=user_embedding, top_matches=top_matches)
+            conv.pending.seal(conv)
+            # Repeated first questions are answered from the semantic cache without calling the model
+            cached = response_cache.lookup(self.profile.cache_namespace, user_embedding) if first_turn else None
+            reply = self.record_reply(conv, user_query, cached) if cached is not None else None
+        # The embedding is reused to store a first-turn reply in the semantic cache
+        return payload, first_turn, reply, user_embedding
+
+    @asynccontextmanager
+    async def conversation_turn(self, session_id):
+        # One turn at a time per conversation, from prompt building until its reply is recorded. A turn
+        # that ends without a reply (busy, timeout, error) is rolled back before the next one starts,
+        # so its query, injected context and counter changes are dropped and a retry starts clean.
+        conv = self.sessions.get(session_id)
+        async with conv.turn_lock:
+            try:
+                yield conv
+            finally:
+                with conv.lock:
+                    if conv.pending is not None:
+                        conv.rollback(conv.pending)
+                        conv.pending = None
+
+    @asynccontextmanager
+    async def inference_slot(self, turn, scheduler, payload, first_turn):
+        # Waits for an inference slot (raises SchedulerBusy under backpressure); the wait is the "queue" stage
+        queue_start = turn.elapsed()
+        async with scheduler.slot(prompt_tokens(payload["messages"]), first_turn):
+            turn.add("queue", turn.elapsed() - queue_start)
+            yield
+
+    async def send_message_async(self, user_query, session_id=DEFAULT_SESSION):
+        turn = begin_turn(self.profile.name)
+        try:
+            scheduler = get_scheduler()
+            scheduler.admit()  # refuse before touching the conversation when the queue is full
+            async with self.conversation_turn(session_id) as conv:
+                payload, first_turn, cached_reply, user_embedding = await self.prepare_turn_async(conv, user_query)
+                if cached_reply is not None:
+                    turn.status = "cached"
+                    return cached_reply
+
+                async with self.inference_slot(turn, scheduler, payload, first_turn):
+                    with stage("inference"):
+                        status, body = await asyncio.wait_for(
+                            post_chat_completion_async(self.profile.infer_url, payload), INFER_DEADLINE
+                        )
+
+                if status == 200:
+                    turn.usage.update(body.get("usage") or {})
+                    generated = body['choices'][0]['message']['content'].strip()
+                    if first_turn:
+                        response_cache.store(self.profile.cache_namespace, user_embedding, generated)
+                    with conv.lock:
+                        return self.record_reply(conv, user_query, generated)
+                else:
+                    turn.status, turn.failed_stage = "error", "inference"
+                    return f"⚠️ Error {status}: {body}"
+        except asyncio.TimeoutError:
+            turn.status = "timeout"
+            return TIMEOUT_REPLY
+        except SchedulerBusy:
+            turn.status = "busy"
+            return BUSY_REPLY
+        except BaseException:
+            turn.status = "error"
+            raise
+        finally:
+            end_turn(turn)
+
+    async def send_message_stream_async(self, user_query, session_id=DEFAULT_SESSION):
+        # Yields reply tokens as vLLM produces them; history and the 300-word check run after the stream ends.
+        # Each step of an async generator may run in a fresh task context, so the turn is held locally.
+        turn = begin_turn(self.profile.name, stream=True)
+        try:
+            scheduler = get_scheduler()
+            scheduler.admit()
+            async with self.conversation_turn(session_id) as conv:
+                payload, first_turn, cached_reply, user_embedding = await self.prepare_turn_async(
+                    conv, user_query, stream=True
+                )
+                if cached_reply is not None:
+                    turn.status = "cached"
+                    yield cached_reply
+                    return
+
+                chunks = []
+                # The slot is held until the stream ends (or the reader goes away)
+                async with self.inference_slot(turn, scheduler, payload, first_turn):
+                    inference_start = turn.elapsed()
+                    try:
+                        deltas = stream_chat_completion_async(self.profile.infer_url, payload, usage=turn.usage)
+                        async for delta in first_item_deadline(deltas, INFER_FIRST_TOKEN_DEADLINE):
+                            if not chunks:
+                                delta = delta.lstrip()
+                                if not delta:
+                                    continue
+                                turn.ttft = turn.elapsed()
+                            chunks.append(delta)
+                            yield delta
+                    except InferenceError as e:
+                        turn.status, turn.failed_stage = "error", "inference"
+                        yield f"⚠️ Error {e.status}: {e.body}"
+                        return
+                    except asyncio.TimeoutError:
+                        turn.status, turn.failed_stage = "timeout", "inference"
+                        yield ("\n\n" if chunks else "") + TIMEOUT_REPLY
+                        return
+                    except Exception:
+                        turn.failed_stage = "inference"
+                        raise
+                    turn.add("inference", turn.elapsed() - inference_start)
+
+                streamed = "".join(chunks).rstrip()
+                if first_turn and streamed:
+                    response_cache.store(self.profile.cache_namespace, user_embedding, streamed)
+                with conv.lock:
+                    reply = self.record_reply(conv, user_query, streamed)
+            if len(reply) > len(streamed):
+                yield reply[len(streamed):]
+        except asyncio.TimeoutError:
+            turn.status = "timeout"
+            yield TIMEOUT_REPLY
+        except SchedulerBusy:
+            turn.status = "busy"
+            yield BUSY_REPLY
+        except GeneratorExit:
+            turn.status = "cancelled"
+            raise
+        except BaseException:
+            turn.status = "error"
+            raise
+        finally:
+            end_turn(turn)
+
+    # --- Sync API (thin wrappers over the shared background event loop) ---
+    def send_message(self, user_query, session_id=DEFAULT_SESSION):
+        return run_sync(self.send_message_async(user_query, session_id))
+
+    def send_message_stream(self, user_query, session_id=DEFAULT_SESSION):
+        return iterate_sync(self.send_message_stream_async(user_query, session_id))
+
+
+# === Engine registry (one engine per profile, created on first use) ===
+_engines = {}
+_engines_lock = threading.Lock()
+_profiles = None
+
+
+def get_profiles():
+    global _profiles
+    with _engines_lock:
+        if _profiles is None:
+            _profiles = load_profiles()
+        return _profiles
+
+
+def get_engine(name):
+    profiles = get_profiles()
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            if name not in profiles:
+                raise KeyError(f"Unknown chat profile {name!r}; known: {', '.join(sorted(profiles))}")
+            engine = _engines[name] = ChatEngine(profiles[name])
+        return engine
+
+
+def engine_stats():
+    # Scrape-time statistics as {metric key: {(label values...): value}}; never loads the model
+    with _engines_lock:
+        sessions = {(name,): len(engine.sessions) for name, engine in _engines.items()}
+    cache = _embedding_cache.stats() if _embedding_cache is not None else {}
+    passages = _passage_cache.stats() if _passage_cache is not None else {}
+    semantic = response_cache.stats()
+    breakers = breaker_stats()
+    return {
+        "sessions": sessions,
+        "embedding_cache": {(key,): cache[key] for key in ("hits", "misses", "size") if key in cache},
+        "passage_cache": {(key,): passages[key] for key in ("hits", "misses", "size") if key in passages},
+        "semantic_cache": {("hits",): semantic["hits"], ("misses",): semantic["misses"]},
+        "circuit_state": {(name,): CIRCUIT_STATES[b["state"]] for name, b in breakers.items()},
+        "circuit_trips": {(name,): b["trips"] for name, b in breakers.items()},
+        "inference_queue": {(key,): value for key, value in scheduler_stats().items()},
+    }
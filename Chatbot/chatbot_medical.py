@@ -1,233 +1,28 @@
-import os
-import requests
-import numpy as np
 import warnings
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-from elasticsearch import Elasticsearch
+from chat_engine import get_engine
 
 # === Disable SSL warnings ===
 warnings.simplefilter('ignore', InsecureRequestWarning)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# === Load embedding model ===
-model = SentenceTransformer("multi-qa-MiniLM-L6-cos-v1", device='cpu')
-
-# === Global state ===
-messages = []
-initial_topic_embedding = None
-context_injected = False
-guiding_questions_done = False
-clarification_rounds = 0
-
-def reset_conversation():
-    global messages, initial_topic_embedding, context_injected, guiding_questions_done, clarification_rounds
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a highly capable Clinical Assistant designed to support users using real medical document records.\n\n"
-                "Always maintain a professional and medically responsible tone.\n\n"
-                "Carefully read the user's question and the context provided.\n"
-                "Use retrieved context only when it is clearly relevant.\n"
-                "Avoid making assumptions. Stay factual.\n\n"
-                "🔵 When responding:\n"
-                "- If unclear, suggest possible differential factors based on general knowledge.\n"
-                "- If partial info, ask ONLY ONE short follow-up question.\n"
-                "- Be respectful, factual, and concise.\n"
-                "- If response exceeds 300 words, ask: 'Would you like me to continue?'"
-            )
-        }
-    ]
-    initial_topic_embedding = None
-    context_injected = False
-    guiding_questions_done = False
-    clarification_rounds = 0
-
-# === Embedding utilities ===
-def get_embedding(text):
-    return model.encode(text)
-
-def calculate_similarity(embedding1, embedding2):
-    embedding1 = np.array(embedding1).reshape(1, -1)
-    embedding2 = np.array(embedding2).reshape(1, -1)
-    return cosine_similarity(embedding1, embedding2)[0][0]
-
-def build_context(top_matches):
-    return "\n\n---\n\n".join(
-        f"{match['content']}\n\n(Source: {match['metadata'].get('source', 'unknown')})"
-        for match in top_matches
-    )
-
-# === Elasticsearch RAG retrieval ===
-def retrieve_most_relevant_embeddings(user_query, top_n=3):
-    es_user = os.environ.get("elastic_user")
-    es_password = os.environ.get("elastic_password")
-
-    es = Elasticsearch(
-        hosts=["https://elasticsearch-sample-elasticsearch.apps.rosa-t59w8.oufo.p1.openshiftapps.com"],
-        basic_auth=(es_user, es_password),
-        verify_certs=False
-    )
-
-    query_embedding = get_embedding(user_query).tolist()
-
-    response = es.search(
-        index="medical-rag-embeddings",
-        body={
-            "size": top_n,
-            "query": {
-                "knn": {
-                    "field": "embedding",
-                    "k": top_n,
-                    "num_candidates": 100,
-                    "query_vector": query_embedding
-                }
-            }
-        }
-    )
-
-    hits = response["hits"]["hits"]
-    relevant_chunks = [
-        {
-            "content": hit["_source"].get("content", ""),
-            "metadata": hit["_source"].get("metadata", {}),
-            "score": hit["_score"]
-        }
-        for hit in hits if hit["_score"] >= 0.4
-    ]
-
-    return relevant_chunks
-
-# === Main message handler ===
-def send_message(user_query):
-    global messages, initial_topic_embedding, context_injected, guiding_questions_done, clarification_rounds
-
-    user_embedding = get_embedding(user_query)
-
-    if initial_topic_embedding is None:
-        initial_topic_embedding = user_embedding
-    elif len(user_query.split()) > 5:
-        similarity = calculate_similarity(initial_topic_embedding, user_embedding)
-        if similarity < 0.5:
-            print(f"🔄 Major topic change detected (similarity {similarity:.2f}). Resetting context.")
-            context_injected = False
-            initial_topic_embedding = user_embedding
-            guiding_questions_done = False
-            clarification_rounds = 0
-
-    if not context_injected:
-        top_matches = retrieve_most_relevant_embeddings(user_query)
-
-        if not top_matches:
-            context_message = {
-                "role": "user",
-                "content": (
-                    "🔵 Context Update:\n\n"
-                    "No strong matching documents found.\n\n"
-                    "(Answer politely based on general clinical knowledge.)"
-                )
-            }
-        else:
-            context = build_context(top_matches)
-            quoted_context = context.replace('\n', '\n> ')
-            context_message = {
-                "role": "user",
-                "content": (
-                    "🔵 Context Update:\n\n"
-                    "Retrieved summaries from medical records:\n\n"
-                    f"> {quoted_context}\n\n"
-                    "(Only use if truly matching.)"
-                )
-            }
-        messages.append(context_message)
-        context_injected = True
-
-    # === Detect vague queries ===
-    user_text_lower = user_query.lower()
-    response_behavior = "normal"
-    vague_keywords = ["problem", "idk", "not sure", "uncertain", "don't know", "symptom"]
-    short_response = len(user_query.split()) <= 4
-
-    if any(vague in user_text_lower for vague in vague_keywords) or short_response:
-        if not guiding_questions_done:
-            response_behavior = "guiding_questions"
-            guiding_questions_done = True
-        else:
-            clarification_rounds += 1
-            if clarification_rounds >= 2:
-                response_behavior = "general_causes"
-            else:
-                response_behavior = "follow_up_question"
-
-    if response_behavior == "guiding_questions":
-        behavior_instruction = {
-            "role": "user",
-            "content": (
-                "🔵 Special Instruction:\n"
-                "The user is unclear. Kindly ask around 5 short guiding questions."
-            )
-        }
-    elif response_behavior == "follow_up_question":
-        behavior_instruction = {
-            "role": "user",
-            "content": (
-                "🔵 Special Instruction:\n"
-                "Ask ONLY ONE very short and polite follow-up question for clarification."
-            )
-        }
-    elif response_behavior == "general_causes":
-        behavior_instruction = {
-            "role": "user",
-            "content": (
-                "🔵 Special Instruction:\n"
-                "Suggest general possible causes based on clinical experience."
-            )
-        }
-    else:
-        behavior_instruction = None
-
-    if behavior_instruction:
-        messages.append(behavior_instruction)
-
-    messages.append({"role": "user", "content": user_query})
-
-    # === Inference call ===
-    payload = {
-        "model": "model",
-        "messages": messages,
-        "max_tokens": 512,
-        "temperature": 0.3,
-        "top_p": 1,
-        "n": 1,
-        "repetition_penalty": 1.1,
-        "presence_penalty": 0.2,
-        "frequency_penalty": 0.2,
-        "stream": False
-    }
-
-    infer_endpoint = "http://model-predictor.minio.svc.cluster.local:8080"
-    infer_url = f"{infer_endpoint}/v1/chat/completions"
-
-    response = requests.post(infer_url, json=payload)
-
-    if response.status_code == 200:
-        output_body = response.json()
-        generated_response = output_body['choices'][0]['message']['content']
-
-        if len(generated_response.split()) > 300:
-            generated_response += "\n\nWould you like me to continue?"
-
-        messages.append({"role": "assistant", "content": generated_response.strip()})
-
-        if len(messages) > 10:
-            messages = messages[:1] + messages[-9:]
-
-        return generated_response.strip()
-    else:
-        return f"⚠️ Error {response.status_code}: {response.text}"
-
-# === On startup ===
-reset_conversation()
+# === Medical assistant: the "medical" profile in profiles.json on the shared chat engine ===
+# The embedding model and connection pools are shared with every other profile in this process.
+engine = get_engine("medical")
+
+ES_HOST = engine.profile.es_host
+INFER_URL = engine.profile.infer_url
+ES_INDEX = engine.profile.index
+SYSTEM_PROMPT = engine.profile.system_prompt
+sessions = engine.sessions
+
+# === Public API (used by medical_streamlit.py) ===
+reset_conversation = engine.reset_conversation
+get_transcript = engine.transcript
+get_embedding = engine.get_embedding
+retrieve_most_relevant_embeddings = engine.retrieve_most_relevant_embeddings
+send_message = engine.send_message
+send_message_stream = engine.send_message_stream
+send_message_async = engine.send_message_async
+send_message_stream_async = engine.send_message_stream_async
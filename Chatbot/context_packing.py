@@ -0,0 +1,97 @@
+import os
+import re
+import numpy as np
+from history import count_tokens
+
+# === Context packing settings (override via environment) ===
+# Off by default: retrieved matches go into the prompt whole, as before.
+CONTEXT_PACKING = os.environ.get("CONTEXT_PACKING", "0") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "768"))  # tokens of retrieved text per prompt
+CONTEXT_CANDIDATES = int(os.environ.get("CONTEXT_CANDIDATES", "6"))        # hits retrieved for packing to choose from
+PASSAGE_MAX_TOKENS = int(os.environ.get("PASSAGE_MAX_TOKENS", "128"))      # longer paragraphs become sentence windows
+DEDUP_SIMILARITY = float(os.environ.get("DEDUP_SIMILARITY", "0.92"))       # cosine above which passages are duplicates
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.7"))                    # 1 = relevance only, 0 = diversity only
+PASSAGE_CACHE_SIZE = int(os.environ.get("PASSAGE_CACHE_SIZE", "8192"))     # passage embeddings kept across turns
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+class Passage:
+    def __init__(self, match_index, order, text):
+        self.match_index = match_index  # which retrieved match it came from
+        self.order = order              # position inside that match, to restore reading order
+        self.text = text
+        self.tokens = count_tokens(text)
+
+
+def split_passages(text, max_tokens=PASSAGE_MAX_TOKENS):
+    # Paragraphs, with long paragraphs cut into windows of whole sentences
+    passages = []
+    for paragraph in _PARAGRAPH.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            passages.append(paragraph)
+            continue
+        window, window_tokens = [], 0
+        for sentence in _SENTENCE.split(paragraph):
+            tokens = count_tokens(sentence)
+            if window and window_tokens + tokens > max_tokens:
+                passages.append(" ".join(window))
+                window, window_tokens = [], 0
+            window.append(sentence)
+            window_tokens += tokens
+        if window:
+            passages.append(" ".join(window))
+    return passages
+
+
+def plan_passages(matches, text_key, max_tokens=PASSAGE_MAX_TOKENS):
+    # Passages of every match, without exact (whitespace/case-insensitive) repeats
+    passages, seen = [], set()
+    for match_index, match in enumerate(matches):
+        for order, text in enumerate(split_passages(match[text_key], max_tokens)):
+            key = " ".join(text.lower().split())
+            if key not in seen:
+                seen.add(key)
+                passages.append(Passage(match_index, order, text))
+    return passages
+
+
+def mmr_select(query_embedding, embeddings, token_counts, budget,
+               lambda_=MMR_LAMBDA, dedup_similarity=DEDUP_SIMILARITY):
+    # Maximal marginal relevance under a token budget. Embeddings are L2-normalized, so dot
+    # products are cosines. Near-duplicates of a chosen passage are dropped; passages that no
+    # longer fit are skipped so shorter relevant ones can still fill the budget.
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    relevance = embeddings @ np.asarray(query_embedding, dtype=np.float32)
+    redundancy = np.zeros(len(embeddings), dtype=np.float32)
+    available = np.ones(len(embeddings), dtype=bool)
+    selected, used = [], 0
+    while available.any():
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        available[best] = False
+        if used + token_counts[best] > budget:
+            continue
+        selected.append(best)
+        used += token_counts[best]
+        similarity = embeddings @ embeddings[best]
+        available &= similarity < dedup_similarity
+        redundancy = np.maximum(redundancy, similarity)
+    return selected
+
+
+def pack_matches(matches, text_key, passages, selected):
+    # Rebuilds the matches from the selected passages (original match and reading order);
+    # matches with nothing selected are dropped
+    chosen = {}
+    for index in selected:
+        chosen.setdefault(passages[index].match_index, []).append(passages[index])
+    packed = []
+    for match_index in sorted(chosen):
+        parts = sorted(chosen[match_index], key=lambda passage: passage.order)
+        packed.append(dict(matches[match_index], **{text_key: "\n\n".join(p.text for p in parts)}))
+    return packed
@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from state_store import encode_embedding, decode_embedding
+
+# === Session store settings (override via environment) ===
+SESSION_MAX_COUNT = int(os.environ.get("SESSION_MAX_COUNT", "500"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "3600"))
+SESSION_MAX_CHARS = int(os.environ.get("SESSION_MAX_CHARS", "200000"))
+TRANSCRIPT_MAX_MESSAGES = int(os.environ.get("TRANSCRIPT_MAX_MESSAGES", "400"))  # displayed turns kept per session
+
+DEFAULT_SESSION = "default"
+
+
+# === Per-session conversation state ===
+class Conversation:
+    def __init__(self, system_prompt):
+        self.system_prompt = system_prompt
+        self.lock = threading.Lock()
+        # Held for a whole async turn (prompt -> reply or rollback), so turns of one conversation
+        # never interleave and each prompt sees the previous reply
+        self.turn_lock = asyncio.Lock()
+        self.pending = None  # TurnCheckpoint of the turn in progress, cleared when its reply is recorded
+        self.last_used = time.monotonic()
+        self.session_id = None
+        # What the state store holds: its version and the messages already written (state_store.py)
+        self.stored_version = None
+        self.stored_messages = []
+        self.stored_transcript = []
+        self.reset()
+
+    def reset(self):
+        self.messages = [{"role": "system", "content": self.system_prompt}]
+        self.initial_topic_embedding = None
+        self.context_injected = False
+        self.guiding_questions_done = False
+        self.clarification_rounds = 0
+        # Previous request's prompt and how much of it the latest request reused (prompt_layout.py)
+        self.last_prompt = []
+        self.prefix_reuse = None
+        # What the user saw (query / reply pairs), for redisplay; `messages` is the token-trimmed
+        # prompt history and loses old questions once they are evicted
+        self.transcript = []
+
+    def add_to_transcript(self, user_query, reply, max_messages=TRANSCRIPT_MAX_MESSAGES):
+        self.transcript += [{"role": "user", "content": user_query}, {"role": "assistant", "content": reply}]
+        if len(self.transcript) > max_messages:
+            # Down to three quarters, in whole turns, so the store rewrites it rarely
+            del self.transcript[:len(self.transcript) - max_messages * 3 // 4 // 2 * 2]
+
+    def state(self):
+        return {
+            "topic_embedding": encode_embedding(self.initial_topic_embedding),
+            "context_injected": self.context_injected,
+            "guiding_questions_done": self.guiding_questions_done,
+            "clarification_rounds": self.clarification_rounds,
+        }
+
+    def restore(self, state, messages, version, transcript=()):
+        self.messages = messages
+        self.transcript = list(transcript)
+        self.stored_transcript = [(msg["role"], msg["content"]) for msg in self.transcript]
+        self.initial_topic_embedding = decode_embedding(state["topic_embedding"])
+        self.context_injected = state["context_injected"]
+        self.guiding_questions_done = state["guiding_questions_done"]
+        self.clarification_rounds = state["clarification_rounds"]
+        self.stored_version = version
+        self.stored_messages = [(msg["role"], msg["content"]) for msg in messages]
+
+    def unchanged_prefix(self, stored_messages=None, messages=None):
+        # Leading messages identical to what the store already holds
+        keep = 0
+        for stored, msg in zip(self.stored_messages if stored_messages is None else stored_messages,
+                               self.messages if messages is None else messages):
+            if stored != (msg["role"], msg["content"]):
+                break
+            keep += 1
+        return keep
+
+    def checkpoint(self):
+        return TurnCheckpoint(self)
+
+    def rollback(self, checkpoint):
+        # Undoes a turn that ended without a reply (busy, timeout, error), unless another turn of
+        # this session has changed the conversation since
+        if checkpoint.after is None:
+            return False
+        messages, length = checkpoint.after
+        if self.messages is not messages or len(messages) != length:
+            return False
+        self.messages = checkpoint.messages
+        (self.initial_topic_embedding, self.context_injected, self.guiding_questions_done,
+         self.clarification_rounds, self.last_prompt, self.prefix_reuse) = checkpoint.state
+        return True
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def size_chars(self):
+        return sum(len(msg.get("content", "")) for msg in self.messages)
+
+    def enforce_memory_cap(self, max_chars=SESSION_MAX_CHARS):
+        # Drop the oldest turns (never the system prompt) until the session fits its cap.
+        while len(self.messages) > 2 and self.size_chars() > max_chars:
+            del self.messages[1]
+
+
+class TurnCheckpoint:
+    # What a turn changes before its reply arrives: the history and the per-topic counters
+    def __init__(self, conv):
+        self.messages = list(conv.messages)
+        self.state = (conv.initial_topic_embedding, conv.context_injected, conv.guiding_questions_done,
+                      conv.clarification_rounds, conv.last_prompt, conv.prefix_reuse)
+        self.after = None
+
+    def seal(self, conv):
+        # Called once the turn's prompt is built; rollback only applies while history is still as left here
+        self.after = (conv.messages, len(conv.messages))
+
+
+# === Bounded session store (LRU + idle TTL) ===
+# With a state store (state_store.py) this is a cache in front of it: conversations load lazily,
+# are re-read when another replica has written a newer version, and are saved after every turn.
+class SessionStore:
+    def __init__(self, factory, max_sessions=SESSION_MAX_COUNT, idle_ttl=SESSION_IDLE_TTL, backend=None, namespace=""):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self.namespace = namespace
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id=DEFAULT_SESSION):
+        with self._lock:
+            self._evict_idle()
+            conversation = self._sessions.get(session_id)
+            if conversation is not None and self.backend is not None:
+                if self.backend.version(self.namespace, session_id) != conversation.stored_version:
+                    conversation = None  # stale copy: another replica served a later turn
+            if conversation is None:
+                conversation = self._load(session_id)
+                self._sessions[session_id] = conversation
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            conversation.touch()
+            return conversation
+
+    def _load(self, session_id):
+        conversation = self.factory()
+        conversation.session_id = session_id
+        stored = self.backend.load(self.namespace, session_id) if self.backend is not None else None
+        if stored is not None:
+            conversation.restore(*stored)
+        return conversation
+
+    def save(self, conversation):
+        # Called under conversation.lock once a turn is complete; writes only the changed tail
+        if self.backend is None or conversation.session_id is None:
+            return
+        conversation.stored_version = self.backend.save(
+            self.namespace, conversation.session_id, conversation.state(), conversation.messages,
+            keep=conversation.unchanged_prefix(), expected_version=conversation.stored_version,
+            transcript=conversation.transcript,
+            transcript_keep=conversation.unchanged_prefix(conversation.stored_transcript, conversation.transcript),
+        )
+        conversation.stored_messages = [(msg["role"], msg["content"]) for msg in conversation.messages]
+        conversation.stored_transcript = [(msg["role"], msg["content"]) for msg in conversation.transcript]
+
+    def reset(self, session_id=DEFAULT_SESSION):
+        conversation = self.get(session_id)
+        with conversation.lock:
+            conversation.reset()
+            if self.backend is not None:
+                self.backend.delete(self.namespace, session_id)
+                conversation.stored_version = None
+                conversation.stored_messages = []
+                conversation.stored_transcript = []
+        return conversation
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        # Least-recently-used sessions sit at the front of the OrderedDict.
+        while self._sessions:
+            session_id, conversation = next(iter(self._sessions.items()))
+            if conversation.last_used >= cutoff:
+                break
+            del self._sessions[session_id]
@@ -0,0 +1,139 @@
+import os
+import json
+import numpy as np
+
+# === Embedding backend settings (override via environment) ===
+# "torch" (default): sentence-transformers on PyTorch.
+# "onnx":  the same model exported to ONNX and run with ONNX Runtime.
+# "onnx-int8": the ONNX export with dynamic int8 quantization of the linear layers.
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL_DIR = os.environ.get(
+    "EMBEDDING_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "multi-qa-MiniLM-L6-cos-v1"),
+)
+ONNX_MODEL_DIR = os.environ.get(
+    "ONNX_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_model"),
+)
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))  # 0 = let ONNX Runtime decide
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _max_seq_length(model_dir):
+    try:
+        with open(os.path.join(model_dir, "sentence_bert_config.json"), encoding="utf-8") as f:
+            return int(json.load(f).get("max_seq_length", 512))
+    except FileNotFoundError:
+        return 512
+
+
+# === ONNX export (needs torch + transformers; run once, e.g. at image build time) ===
+def export_onnx(model_dir=EMBEDDING_MODEL_DIR, out_dir=ONNX_MODEL_DIR, quantize=True):
+    # Exports the transformer body only; mean pooling and normalization run in NumPy (OnnxEmbedder).
+    import torch
+    from transformers import AutoModel
+
+    os.makedirs(out_dir, exist_ok=True)
+    onnx_path = os.path.join(out_dir, ONNX_FILE)
+    model = AutoModel.from_pretrained(model_dir).eval()
+    dummy = {
+        "input_ids": torch.ones(1, 8, dtype=torch.long),
+        "attention_mask": torch.ones(1, 8, dtype=torch.long),
+        "token_type_ids": torch.zeros(1, 8, dtype=torch.long),
+    }
+    dynamic = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        model,
+        tuple(dummy.values()),  # BertModel.forward(input_ids, attention_mask, token_type_ids)
+        onnx_path,
+        input_names=list(dummy),
+        output_names=["last_hidden_state"],
+        dynamic_axes={name: dynamic for name in list(dummy) + ["last_hidden_state"]},
+        opset_version=14,
+    )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantize_dynamic(onnx_path, os.path.join(out_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    return onnx_path
+
+
+# === ONNX Runtime encoder ===
+class OnnxEmbedder:
+    # Drop-in for SentenceTransformer.encode on this model: same tokenizer, mean pooling, L2 normalization.
+    def __init__(self, model_dir=EMBEDDING_MODEL_DIR, onnx_dir=ONNX_MODEL_DIR, quantized=False, threads=ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        onnx_path = os.path.join(onnx_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"{onnx_path} not found; run `python embedding_backends.py export` first")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=_max_seq_length(model_dir))
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        vectors = np.vstack(out) if out else np.zeros((0, 384), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        return mean_pool_normalize(hidden, feeds["attention_mask"])
+
+
+def mean_pool_normalize(hidden, attention_mask):
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    return (pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+
+# === Backend selection ===
+def load_embedding_model(backend=EMBEDDING_BACKEND, model_name_or_dir="multi-qa-MiniLM-L6-cos-v1", fallback=True):
+    # Returns an object with a SentenceTransformer-compatible encode(); the ONNX backends never import torch.
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if backend != "torch":
+        try:
+            return OnnxEmbedder(quantized=backend == "onnx-int8")
+        except ImportError as e:
+            if not fallback:
+                raise
+            # onnxruntime / tokenizers are opt-in (requirements.txt): serve with PyTorch rather than not at all
+            print(f"⚠️ EMBEDDING_BACKEND={backend} needs onnxruntime ({e}); falling back to torch")
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name_or_dir, device='cpu')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX (optionally int8-quantized).")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--model-dir", default=EMBEDDING_MODEL_DIR)
+    parser.add_argument("--out-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 variant")
+    args = parser.parse_args()
+    path = export_onnx(args.model_dir, args.out_dir, quantize=not args.no_quantize)
+    print(f"✅ Exported {path}" + ("" if args.no_quantize else f" and {ONNX_INT8_FILE}"))
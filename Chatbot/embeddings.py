@@ -0,0 +1,161 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+
+# === Embedding settings (override via environment) ===
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+
+def normalize_text(text):
+    # multi-qa-MiniLM uses an uncased, whitespace-splitting tokenizer, so this key is lossless.
+    return " ".join(text.lower().split())
+
+
+# === Bounded LRU cache of query embeddings ===
+class EmbeddingCache:
+    def __init__(self, encode, max_entries=EMBEDDING_CACHE_SIZE):
+        self.encode = encode
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        key = normalize_text(text)
+        embedding = self._lookup(key)
+        if embedding is None:
+            # Encode outside the lock so concurrent misses don't serialize on the cache.
+            embedding = self._store(key, self.encode(key))
+        return embedding
+
+    async def get_async(self, text, submit):
+        # `submit` returns a concurrent Future (e.g. EmbeddingBatcher.submit); awaiting it keeps the event loop free.
+        key = normalize_text(text)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = self._store(key, await asyncio.wrap_future(submit(key)))
+        return embedding
+
+    def get_many(self, texts, submit):
+        # Every miss goes to `submit` before any result is awaited, so the misses share one batch
+        keys = [normalize_text(text) for text in texts]
+        found = {key: self._lookup(key) for key in dict.fromkeys(keys)}
+        pending = {key: submit(key) for key, embedding in found.items() if embedding is None}
+        for key, future in pending.items():
+            found[key] = self._store(key, future.result())
+        return [found[key] for key in keys]
+
+    def _lookup(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return embedding
+
+    def _store(self, key, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return embedding
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+# === Micro-batching encoder ===
+class EmbeddingBatcher:
+    # Collects concurrent encode requests for up to max_wait_ms and runs them as one batched encode.
+    def __init__(self, encode_batch, max_batch_size=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, text):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text):
+        return self.submit(text).result()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Callers that gave up (e.g. an encode deadline) are dropped instead of encoded
+            batch = [(text, future) for text, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            # Identical texts in the same window share one row of the batch
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = np.asarray(self.encode_batch(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            rows = dict(zip(texts, vectors))
+            for text, future in batch:
+                future.set_result(rows[text])
+            self.batches += 1
+            self.items += len(batch)
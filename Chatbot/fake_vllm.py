@@ -0,0 +1,145 @@
+import sys
+import json
+import time
+import threading
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for vLLM's OpenAI-compatible /v1/chat/completions, for offline benchmarks.
+# Usage:
+#   python fake_vllm.py --port 8080 --ttft-ms 150 --token-ms 20 --reply-tokens 120
+# then point <PROFILE>_INFER_URL at http://127.0.0.1:8080/v1/chat/completions.
+
+REPLY_WORDS = ("Please try restarting the service and check the logs for the first error reported "
+               "then confirm the configuration matches the documented defaults").split()
+
+
+class FakeChatServer:
+    def __init__(self, host="127.0.0.1", port=0, ttft_ms=100.0, token_ms=10.0, reply_tokens=64, slots=0, error_rate=0.0):
+        # slots > 0 caps concurrently generating requests, like vLLM's batch size; the rest queue
+        self.ttft = ttft_ms / 1000.0
+        self.token_delay = token_ms / 1000.0
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.requests = 0
+        self._slots = threading.BoundedSemaphore(slots) if slots > 0 else None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-vllm", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def _next_request(self):
+        # Deterministic error injection: every round(1 / error_rate)-th request fails
+        with self._lock:
+            self.requests += 1
+            return self.error_rate > 0 and self.requests % max(1, round(1 / self.error_rate)) == 0
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if server._next_request():
+                    return self._send_json(503, {"error": "injected failure"})
+                prompt_tokens = sum(len(m.get("content", "").split()) for m in payload.get("messages", []))
+                tokens = min(server.reply_tokens, int(payload.get("max_tokens") or server.reply_tokens))
+                if server._slots:
+                    server._slots.acquire()
+                try:
+                    if payload.get("stream"):
+                        include_usage = (payload.get("stream_options") or {}).get("include_usage")
+                        self._stream(tokens, prompt_tokens if include_usage else None)
+                    else:
+                        time.sleep(server.ttft + server.token_delay * tokens)
+                        self._send_json(200, {
+                            "object": "chat.completion",
+                            "model": payload.get("model", "model"),
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": _reply(tokens)},
+                                         "finish_reason": "length" if tokens < server.reply_tokens else "stop"}],
+                            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+                                      "total_tokens": prompt_tokens + tokens},
+                        })
+                finally:
+                    if server._slots:
+                        server._slots.release()
+
+            def _stream(self, tokens, prompt_tokens=None):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                time.sleep(server.ttft)
+                for i in range(tokens):
+                    if i:
+                        time.sleep(server.token_delay)
+                    chunk = {"object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {"content": " " + REPLY_WORDS[i % len(REPLY_WORDS)]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                if prompt_tokens is not None:
+                    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+                             "total_tokens": prompt_tokens + tokens}
+                    self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _reply(tokens):
+    return " ".join(REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(tokens))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ttft-ms", type=float, default=100.0, help="Delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="Delay between tokens")
+    parser.add_argument("--reply-tokens", type=int, default=64)
+    parser.add_argument("--slots", type=int, default=0, help="Max concurrently generating requests (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args(argv)
+    server = FakeChatServer(args.host, args.port, args.ttft_ms, args.token_ms, args.reply_tokens, args.slots, args.error_rate)
+    print(f"🧪 Fake vLLM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
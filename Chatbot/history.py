@@ -0,0 +1,104 @@
+import os
+import glob
+import threading
+from functools import lru_cache
+
+# === Token budget settings (override via environment) ===
+# CONTEXT_WINDOW_TOKENS should match vLLM's --max-model-len; the prompt gets what is left after max_tokens.
+CONTEXT_WINDOW_TOKENS = int(os.environ.get("CONTEXT_WINDOW_TOKENS", "4096"))
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "0"))  # 0 = derive from the context window
+HISTORY_SUMMARY = os.environ.get("HISTORY_SUMMARY", "0") == "1"
+
+# Granite chat template wraps each message as <|start_of_role|>{role}<|end_of_role|>{content}<|end_of_text|>\n
+MESSAGE_OVERHEAD_TOKENS = 5
+GENERATION_PROMPT_TOKENS = 4
+SUMMARY_PREFIX = "🔵 Summary of earlier conversation:"
+SUMMARY_LINE_WORDS = 30
+
+TOKENIZER_DIR = os.environ.get(
+    "TOKENIZER_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer", "models--ibm-granite--granite-3.2-8b-instruct"),
+)
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    # The bundled HF cache snapshot; loaded once with the lightweight `tokenizers` library.
+    global _tokenizer
+    if _tokenizer is not None:
+        return _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            from tokenizers import Tokenizer
+
+            matches = sorted(glob.glob(os.path.join(TOKENIZER_DIR, "snapshots", "*", "tokenizer.json")))
+            if not matches:
+                raise FileNotFoundError(f"No tokenizer.json found under {TOKENIZER_DIR}")
+            _tokenizer = Tokenizer.from_file(matches[-1])
+    return _tokenizer
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    # Cached per message content, so each history entry is tokenized once across turns
+    return len(get_tokenizer().encode(text, add_special_tokens=False).ids)
+
+
+def message_tokens(message):
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def prompt_tokens(messages):
+    return sum(message_tokens(msg) for msg in messages) + GENERATION_PROMPT_TOKENS
+
+
+def prompt_budget(max_tokens):
+    if PROMPT_TOKEN_BUDGET > 0:
+        return PROMPT_TOKEN_BUDGET
+    return CONTEXT_WINDOW_TOKENS - max_tokens
+
+
+def summary_line(message):
+    # One short line per evicted user/assistant turn; injected context/instructions are skipped
+    if message["role"] not in ("user", "assistant") or message.get("content", "").startswith("🔵"):
+        return None
+    words = message["content"].split()
+    text = " ".join(words[:SUMMARY_LINE_WORDS]) + (" ..." if len(words) > SUMMARY_LINE_WORDS else "")
+    return f"- {message['role'].capitalize()}: {text}"
+
+
+def trim_to_budget(messages, budget, pinned=(), summarize=HISTORY_SUMMARY):
+    # Evicts the oldest turns until the prompt fits `budget` tokens. The system prompt,
+    # the latest message and any message in `pinned` are never evicted.
+    if prompt_tokens(messages) <= budget:
+        return messages
+
+    keep = list(messages)
+    pinned_ids = {id(msg) for msg in pinned}
+    summary_lines = []
+    i = 1
+    while prompt_tokens(keep) > budget and i < len(keep) - 1:
+        msg = keep[i]
+        if id(msg) in pinned_ids:
+            i += 1
+            continue
+        if msg.get("content", "").startswith(SUMMARY_PREFIX):
+            # Fold a previous summary into the new one rather than keeping both
+            summary_lines.extend(msg["content"].splitlines()[1:])
+        else:
+            line = summary_line(msg)
+            if line:
+                summary_lines.append(line)
+        del keep[i]
+
+    if summarize:
+        # Oldest summary lines go first until the summary fits alongside the kept turns
+        while summary_lines:
+            summary = {"role": "user", "content": "\n".join([SUMMARY_PREFIX] + summary_lines)}
+            candidate = keep[:1] + [summary] + keep[1:]
+            if prompt_tokens(candidate) <= budget:
+                return candidate
+            summary_lines.pop(0)
+    return keep
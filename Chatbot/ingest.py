@@ -0,0 +1,385 @@
+import os
+import re
+import csv
+import sys
+import json
+import hashlib
+import argparse
+from itertools import islice
+import numpy as np
+from tqdm import tqdm
+from local_index import LocalVectorIndex, local_index_path, DOCUMENTS_FILE, EMBEDDINGS_FILE
+
+# Usage:
+#   python ingest.py helpdesk --source helpdesk_small_sample.csv --target local
+#   python ingest.py medical --source parsed_medical_chunks.jsonl --target elasticsearch --es-host https://... --prune
+# Re-running only re-embeds documents whose content hash changed.
+# Medical fragments are merged into token-sized windows (--chunk-tokens 0 indexes them one by one).
+
+MODEL_NAME = "multi-qa-MiniLM-L6-cos-v1"
+EMBEDDING_DIM = 384
+
+# Medical chunk windows, in Granite tokens (the unit prompt budgets use)
+CHUNK_TOKENS = 256
+CHUNK_OVERLAP = 48
+CHUNK_MIN_TOKENS = 64  # a section heading only closes the current window once it holds this much
+
+# Some GitHub issue bodies are far larger than the csv module's default field limit
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+# === Text cleaning (same rules as EDA_Chatbot.ipynb, so both ingestion paths index the same text) ===
+URL_RE = re.compile(r"http\S+")
+MENTION_RE = re.compile(r"@\w+")
+ISSUE_REF_RE = re.compile(r"#\d+")
+WHITESPACE_RE = re.compile(r"\s+")
+BOT_AUTHOR_RE = re.compile(r"\[bot\]$")  # e.g. "stale[bot]"; the notebook drops these answers (df_no_bots)
+
+
+def clean_text(text):
+    if text is None:
+        return ""
+    text = str(text)
+    text = URL_RE.sub("<link>", text)      # Replace URLs
+    text = MENTION_RE.sub("", text)        # Remove @mentions
+    text = ISSUE_REF_RE.sub("", text)      # Remove issue references like #123
+    text = WHITESPACE_RE.sub(" ", text)    # Collapse whitespace
+    return text.strip()
+
+
+def is_bot(author):
+    return bool(author) and bool(BOT_AUTHOR_RE.search(author))
+
+
+def content_hash(text):
+    return hashlib.sha1(f"{MODEL_NAME}\n{text}".encode("utf-8")).hexdigest()
+
+
+# === Source readers (streamed, one document at a time) ===
+# Each reader yields (doc_id, source_fields, text_to_embed).
+
+def iter_helpdesk_documents(path):
+    # Accepts either the cleaned long format (issue_id, answer_id, issue_body, answer_body, ...)
+    # or the raw Kaggle dump with answers_0_body .. answers_9_body columns on each issue row.
+    # Long-format rows must be grouped by issue_id, as EDA_Chatbot.ipynb exports them.
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        raw_format = "answers_0_body" in (reader.fieldnames or [])
+
+        current_id, issue_body, answers = None, "", []
+        for row_number, row in enumerate(reader):
+            if raw_format:
+                issue_id = row.get("id") or str(row_number)
+                answers = [(i, row.get(f"answers_{i}_body")) for i in range(10)
+                           if (row.get(f"answers_{i}_body") or row.get(f"answers_{i}_author"))
+                           and not is_bot(row.get(f"answers_{i}_author"))]
+                if answers:  # like the notebook's long format, issues without (human) answers are left out
+                    yield _helpdesk_document(issue_id, row.get("body"), answers)
+                continue
+
+            issue_id = row["issue_id"]
+            if is_bot(row.get("author")):
+                continue
+            if issue_id != current_id:
+                if current_id is not None:
+                    yield _helpdesk_document(current_id, issue_body, answers)
+                current_id, issue_body, answers = issue_id, row.get("issue_body"), []
+            answers.append((int(row.get("answer_id") or len(answers)), row.get("answer_body")))
+
+        if current_id is not None:
+            yield _helpdesk_document(current_id, issue_body, answers)
+
+
+def _helpdesk_document(issue_id, issue_body, answers):
+    issue_body = clean_text(issue_body)
+    answer_body = " ".join(clean_text(body) for _, body in sorted(answers, key=lambda a: a[0]))
+    source = {"issue_id": str(issue_id), "issue_body": issue_body, "answer_body": answer_body}
+    return str(issue_id), source, f"{issue_body} {answer_body}"
+
+
+def iter_medical_fragments(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            content = str(record.get("content") or "").strip()
+            if content:
+                yield content, record.get("metadata") or {}
+
+
+def iter_medical_documents(path, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    fragments = iter_medical_fragments(path)
+    if chunk_tokens:
+        fragments = merge_fragments(fragments, chunk_tokens, overlap)
+    for content, metadata in fragments:
+        # Content-addressed ids: unchanged chunks keep their id across re-runs
+        doc_id = "doc-" + hashlib.sha1(f"{metadata.get('source', '')}\n{content}".encode("utf-8")).hexdigest()[:16]
+        yield doc_id, {"content": content, "metadata": metadata}, content
+
+
+# === Medical chunk merging ===
+# The PDF parser emits one fragment per line ("Date: 6/2/04", "HEENT:"). Adjacent fragments of the
+# same source are merged into windows of at most `chunk_tokens`, overlapping by a tail of whole
+# sentences, and windows break at section headings so a chunk rarely mixes two sections.
+HEADING_RE = re.compile(r"^[^.!?:]{2,60}[:\u2013-]?$")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def is_heading(text):
+    # Short label lines without sentence punctuation or a "Field: value" pair,
+    # e.g. "History of Present Illness", "Social History –", "HEENT:"
+    return "\n" not in text and len(text.split()) <= 6 and bool(HEADING_RE.match(text))
+
+
+def _word_windows(text, max_tokens):
+    # A single sentence longer than a window is cut between words
+    from history import count_tokens
+
+    window, window_tokens = [], 0
+    for word in text.split():
+        tokens = count_tokens(" " + word)
+        if window and window_tokens + tokens > max_tokens:
+            yield " ".join(window)
+            window, window_tokens = [], 0
+        window.append(word)
+        window_tokens += tokens
+    if window:
+        yield " ".join(window)
+
+
+def fragment_units(content, max_tokens):
+    # (separator, sentence) pairs: sentences are the unit of packing and of overlap
+    from history import count_tokens
+
+    for line in content.splitlines():
+        sentences = [sentence for sentence in SENTENCE_RE.split(line.strip()) if sentence]
+        for number, sentence in enumerate(sentences):
+            separator = " " if number else "\n"
+            pieces = _word_windows(sentence, max_tokens) if count_tokens(sentence) > max_tokens else [sentence]
+            for piece_number, piece in enumerate(pieces):
+                yield (separator if not piece_number else " "), piece
+
+
+def merge_fragments(fragments, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP, min_tokens=CHUNK_MIN_TOKENS):
+    # fragments: (content, metadata) in document order; yields merged (content, metadata).
+    # Window sizes count every separator and the "(continued)" header, so no window exceeds chunk_tokens.
+    from history import count_tokens
+
+    source, metadata, section = None, {}, None
+    window, window_tokens, window_section, header = [], 0, None, None  # window: [(separator, text, tokens)]
+
+    def emit():
+        text = "".join(separator + piece for separator, piece, _ in window).lstrip("\n ")
+        if header:
+            text = f"{header}\n{text}"
+        return text, dict(metadata, section=window_section) if window_section else dict(metadata)
+
+    def open_window(opens_section, next_tokens, previous=()):
+        # A window is labelled by the section it starts in; mid-section windows get a header line
+        nonlocal window, window_tokens, window_section, header
+        window_section = section
+        header = f"{section} (continued)" if section and not opens_section else None
+        window_tokens = count_tokens(header) + 1 if header else 0
+        window = overlap_tail(previous, min(overlap, chunk_tokens - window_tokens - next_tokens))
+        window_tokens += sum(tokens for _, _, tokens in window)
+
+    def overlap_tail(units, budget):
+        # Trailing sentences worth at most `budget` tokens; the end of the last sentence if none fits
+        tail, tail_tokens = [], 0
+        for unit in reversed(units):
+            if tail_tokens + unit[2] > budget:
+                break
+            tail.insert(0, unit)
+            tail_tokens += unit[2]
+        if not tail and units and budget > 0:
+            words = units[-1][1].split()
+            while words and count_tokens(" " + " ".join(words)) + 1 > budget:
+                words.pop(0)
+            if words:
+                piece = " ".join(words)
+                tail = [("\n", piece, count_tokens(" " + piece) + 1)]
+        return tail
+
+    for content, fragment_metadata in fragments:
+        fragment_source = fragment_metadata.get("source")
+        heading = is_heading(content)
+        if fragment_source != source:
+            if window:
+                yield emit()
+            window, source, metadata, section = [], fragment_source, fragment_metadata, None
+        elif heading and window and window_tokens >= min_tokens:
+            yield emit()
+            window = []
+        if heading:
+            section = content.rstrip(" :\u2013-")
+
+        # Room left for sentences in a window that also carries a header line
+        max_tokens = chunk_tokens - (count_tokens(f"{section} (continued)") + 1 if section else 0) - 1
+        for number, (separator, piece) in enumerate(fragment_units(content, max_tokens)):
+            tokens = count_tokens(separator + piece)
+            if not window:
+                open_window(heading and number == 0, tokens)
+            elif window_tokens + tokens > chunk_tokens:
+                yield emit()
+                open_window(False, tokens, previous=window)
+            window.append((separator, piece, tokens))
+            window_tokens += tokens
+    if window:
+        yield emit()
+
+
+CORPORA = {
+    "helpdesk": {
+        "index": "helpdesk-embeddings",
+        "reader": iter_helpdesk_documents,
+        "source": "helpdesk_small_sample.csv",
+        "mappings": {
+            "issue_id": {"type": "keyword"},
+            "issue_body": {"type": "text"},
+            "answer_body": {"type": "text"},
+        },
+    },
+    "medical": {
+        "index": "medical-rag-embeddings",
+        "reader": iter_medical_documents,
+        "source": "parsed_medical_chunks.jsonl",
+        "mappings": {
+            "content": {"type": "text"},
+            "metadata": {"type": "object"},
+        },
+    },
+}
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def embed_changed(documents, existing_hashes, model, batch_size, stats):
+    # Yields (doc_id, source, embedding-or-None); None means the stored vector is still current.
+    for batch in batched(documents, batch_size):
+        pending = []
+        for doc_id, source, text in batch:
+            digest = content_hash(text)
+            source = dict(source, content_hash=digest)
+            if existing_hashes.get(doc_id) == digest:
+                stats["unchanged"] += 1
+                yield doc_id, source, None
+            else:
+                pending.append((doc_id, source, text))
+
+        if pending:
+            vectors = model.encode([text for _, _, text in pending], batch_size=batch_size, convert_to_numpy=True)
+            for (doc_id, source, _), vector in zip(pending, vectors):
+                stats["embedded"] += 1
+                yield doc_id, source, np.asarray(vector, dtype=np.float32)
+
+
+# === Targets ===
+def ingest_local(index_name, documents, model, batch_size, full, stats):
+    path = local_index_path(index_name)
+    existing = {}
+    if not full and os.path.exists(os.path.join(path, DOCUMENTS_FILE)) and os.path.exists(os.path.join(path, EMBEDDINGS_FILE)):
+        previous = LocalVectorIndex(path)
+        existing = {doc["_id"]: (row, doc["_source"].get("content_hash")) for row, doc in enumerate(previous.documents)}
+    existing_hashes = {doc_id: digest for doc_id, (_, digest) in existing.items()}
+
+    out_documents, out_vectors, seen = [], [], set()
+    for doc_id, source, vector in embed_changed(documents, existing_hashes, model, batch_size, stats):
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        if vector is None:
+            vector = np.array(previous.embeddings[existing[doc_id][0]])
+        out_documents.append({"_id": doc_id, "_source": source})
+        out_vectors.append(vector)
+
+    stats["removed"] = len(set(existing) - seen)
+    matrix = np.vstack(out_vectors) if out_vectors else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    LocalVectorIndex.write(path, out_documents, matrix)
+
+
+def ingest_elasticsearch(es, index_name, mappings, documents, model, batch_size, full, prune, threads, stats):
+    from elasticsearch import helpers
+
+    if not es.indices.exists(index=index_name):
+        properties = dict(mappings)
+        properties["content_hash"] = {"type": "keyword"}
+        properties["embedding"] = {"type": "dense_vector", "dims": EMBEDDING_DIM, "index": True, "similarity": "cosine"}
+        es.indices.create(index=index_name, mappings={"properties": properties})
+
+    existing_hashes = {}
+    if not full or prune:
+        for hit in helpers.scan(es, index=index_name, _source=["content_hash"], query={"query": {"match_all": {}}}):
+            existing_hashes[hit["_id"]] = hit["_source"].get("content_hash")
+    compare_hashes = {} if full else existing_hashes
+
+    seen = set()
+
+    def actions():
+        for doc_id, source, vector in embed_changed(documents, compare_hashes, model, batch_size, stats):
+            seen.add(doc_id)
+            if vector is not None:
+                yield {"_index": index_name, "_id": doc_id, "_source": dict(source, embedding=vector.tolist())}
+
+    for ok, info in helpers.parallel_bulk(es, actions(), thread_count=threads, chunk_size=batch_size, raise_on_error=False):
+        if not ok:
+            stats["errors"] += 1
+            print(f"⚠️ Bulk error: {info}", file=sys.stderr)
+
+    if prune:
+        stale = set(existing_hashes) - seen
+        deletes = ({"_op_type": "delete", "_index": index_name, "_id": doc_id} for doc_id in stale)
+        for ok, _ in helpers.parallel_bulk(es, deletes, thread_count=threads, raise_on_error=False):
+            stats["removed" if ok else "errors"] += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embed and index the helpdesk / medical corpora.")
+    parser.add_argument("corpus", choices=sorted(CORPORA))
+    parser.add_argument("--source", help="CSV (helpdesk) or JSONL (medical) input; defaults to the bundled sample")
+    parser.add_argument("--target", choices=["elasticsearch", "local"], default="local")
+    parser.add_argument("--index", help="Index name (defaults to the name the backend queries)")
+    parser.add_argument("--es-host", default=os.environ.get("ES_HOST"))
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=4, help="parallel_bulk worker threads")
+    parser.add_argument("--full", action="store_true", help="Re-embed everything, ignoring stored content hashes")
+    parser.add_argument("--prune", action="store_true", help="Delete ES documents no longer present in the source")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS,
+                        help="Medical: merge fragments into windows of this many tokens (0 = one document per fragment)")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="Medical: tokens repeated between windows")
+    args = parser.parse_args(argv)
+
+    corpus = CORPORA[args.corpus]
+    index_name = args.index or corpus["index"]
+    source = args.source or corpus["source"]
+    if args.corpus == "medical":
+        documents = corpus["reader"](source, args.chunk_tokens, args.chunk_overlap)
+    else:
+        documents = corpus["reader"](source)
+    documents = tqdm(documents, desc=f"Indexing {index_name}", unit="doc")
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME, device=args.device)
+
+    stats = {"embedded": 0, "unchanged": 0, "removed": 0, "errors": 0}
+    if args.target == "local":
+        ingest_local(index_name, documents, model, args.batch_size, args.full, stats)
+    else:
+        if not args.es_host:
+            parser.error("--es-host (or ES_HOST) is required for --target elasticsearch")
+        from transport import get_es_client
+        es = get_es_client(args.es_host)
+        ingest_elasticsearch(es, index_name, corpus["mappings"], documents, model, args.batch_size,
+                             args.full, args.prune, args.threads, stats)
+
+    print(f"✅ {index_name}: {stats['embedded']} embedded, {stats['unchanged']} unchanged, "
+          f"{stats['removed']} removed, {stats['errors']} errors")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
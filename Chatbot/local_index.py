@@ -0,0 +1,110 @@
+import os
+import json
+import threading
+import numpy as np
+
+# === Retrieval backend selection (override via environment) ===
+# "elasticsearch" (default) queries the cluster; "local" uses the on-disk index below.
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "elasticsearch")
+LOCAL_INDEX_ROOT = os.environ.get("LOCAL_INDEX_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_index"))
+
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCUMENTS_FILE = "documents.jsonl"
+
+
+def local_index_path(index_name):
+    return os.path.join(LOCAL_INDEX_ROOT, index_name)
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+# === In-process vector index ===
+class LocalVectorIndex:
+    # Normalized float32 matrix memory-mapped from disk plus one JSON document per row.
+    def __init__(self, path):
+        self.path = path
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(path, DOCUMENTS_FILE), encoding="utf-8") as f:
+            self.documents = [json.loads(line) for line in f if line.strip()]
+        if len(self.documents) != self.embeddings.shape[0]:
+            raise ValueError(f"{path}: {len(self.documents)} documents but {self.embeddings.shape[0]} embeddings")
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query_embedding, top_n=3):
+        # Returns ES-shaped hits ({"_id", "_source", "_score"}), best first.
+        if not self.documents:
+            return []
+        query = normalize_rows(query_embedding)
+        similarities = self.embeddings @ query
+        k = min(top_n, len(self.documents))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [
+            {
+                "_id": self.documents[i]["_id"],
+                "_source": self.documents[i]["_source"],
+                # Same scale as an ES dense_vector "cosine" kNN score, so the 0.4 threshold carries over
+                "_score": float((1.0 + similarities[i]) / 2.0),
+            }
+            for i in top
+        ]
+
+    @staticmethod
+    def write(path, documents, embeddings):
+        # documents: list of {"_id": ..., "_source": {...}} aligned with the embedding rows
+        os.makedirs(path, exist_ok=True)
+        matrix = normalize_rows(embeddings)
+        matrix = matrix.reshape(len(documents), matrix.shape[-1])  # shape[-1], not -1: an empty index is valid
+
+        tmp_embeddings = os.path.join(path, EMBEDDINGS_FILE + ".tmp")
+        tmp_documents = os.path.join(path, DOCUMENTS_FILE + ".tmp")
+        with open(tmp_embeddings, "wb") as f:
+            np.save(f, matrix)
+        with open(tmp_documents, "w", encoding="utf-8") as f:
+            for doc in documents:
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+        os.replace(tmp_embeddings, os.path.join(path, EMBEDDINGS_FILE))
+        os.replace(tmp_documents, os.path.join(path, DOCUMENTS_FILE))
+        drop_cached_index(path)
+
+
+# === Shared, lazily loaded indexes ===
+_lock = threading.Lock()
+_indexes = {}
+
+
+def get_local_index(index_name):
+    path = local_index_path(index_name)
+    index = _indexes.get(path)
+    if index is not None:
+        return index
+    with _lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = LocalVectorIndex(path)
+            _indexes[path] = index
+    return index
+
+
+def drop_cached_index(path):
+    with _lock:
+        _indexes.pop(path, None)
+
+
+def export_from_elasticsearch(es, index_name, embedding_field="embedding"):
+    # Snapshot an existing ES index (sources + vectors) into the local index directory.
+    from elasticsearch import helpers
+
+    documents, embeddings = [], []
+    for hit in helpers.scan(es, index=index_name, query={"query": {"match_all": {}}}):
+        source = dict(hit["_source"])
+        embeddings.append(source.pop(embedding_field))
+        documents.append({"_id": hit["_id"], "_source": source})
+    LocalVectorIndex.write(local_index_path(index_name), documents, np.asarray(embeddings, dtype=np.float32))
+    return len(documents)
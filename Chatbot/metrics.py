@@ -0,0 +1,226 @@
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import timing
+
+# === Metrics settings (override via environment) ===
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0 = no endpoint; e.g. 9100 for Prometheus scraping
+METRICS_HOST = os.environ.get("METRICS_HOST", "0.0.0.0")
+TRACE_LOG = os.environ.get("TRACE_LOG", "")  # JSONL file with one record per turn; empty = off
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+SCORE_BUCKETS = (0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+RATIO_BUCKETS = (0.0, 0.25, 0.5, 0.75, 0.9, 0.95, 1.0)
+
+
+# === Minimal Prometheus text-format registry ===
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, *labels, value):
+        with self._lock:
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', '+Inf')])} {series[-2]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-2]}")
+        return lines
+
+
+class Gauges:
+    # Values read at scrape time from a callback returning {(label values...): value}
+    def __init__(self, name, help, labelnames, collect):
+        self.name, self.help, self.labelnames, self.collect = name, help, tuple(labelnames), collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+# === Chat pipeline metrics ===
+turns_total = Counter("chat_turns_total", "Chat turns by final status", ["profile", "status"])
+stage_seconds = Histogram("chat_stage_seconds", "Time per pipeline stage (ttft/total per turn)", ["profile", "stage"])
+prompt_tokens = Histogram("chat_prompt_tokens", "Prompt tokens per inference request (vLLM usage)", ["profile"], TOKEN_BUCKETS)
+completion_tokens = Histogram("chat_completion_tokens", "Completion tokens per reply (vLLM usage)", ["profile"], TOKEN_BUCKETS)
+tokens_total = Counter("chat_tokens_total", "Tokens processed by vLLM", ["profile", "kind"])
+retrieval_matches = Histogram("chat_retrieval_matches", "Retrieved hits above the score threshold", ["profile"], COUNT_BUCKETS)
+retrieval_top_score = Histogram("chat_retrieval_top_score", "Best retrieval score per search", ["profile"], SCORE_BUCKETS)
+retrieval_empty_total = Counter("chat_retrieval_empty_total", "Searches with no hit above the threshold", ["profile"])
+retrieval_fallback_total = Counter("chat_retrieval_fallback_total", "Searches served without Elasticsearch", ["profile", "fallback", "reason"])
+context_tokens = Histogram("chat_context_tokens", "Retrieved-context tokens before/after packing", ["profile", "phase"], TOKEN_BUCKETS)
+topic_resets_total = Counter("chat_topic_resets_total", "Topic-drift context resets", ["profile"])
+prefix_reuse_ratio = Histogram("chat_prefix_reuse_ratio", "Share of prompt tokens reusable from the previous request", ["profile"], RATIO_BUCKETS)
+upstream_errors_total = Counter("chat_upstream_errors_total", "Failed turns by upstream", ["profile", "upstream"])
+
+
+def _collect_engine(key):
+    # Cheap engine/cache statistics, read only when scraped
+    import chat_engine
+
+    return chat_engine.engine_stats().get(key, {})
+
+
+REGISTRY = [
+    turns_total, stage_seconds, prompt_tokens, completion_tokens, tokens_total, retrieval_matches,
+    retrieval_top_score, retrieval_empty_total, retrieval_fallback_total, context_tokens, topic_resets_total, prefix_reuse_ratio,
+    upstream_errors_total,
+    Gauges("chat_sessions", "Live conversations per profile", ["profile"], lambda: _collect_engine("sessions")),
+    Gauges("chat_embedding_cache", "Query embedding cache counters", ["stat"], lambda: _collect_engine("embedding_cache")),
+    Gauges("chat_passage_cache", "Retrieved-passage embedding cache counters", ["stat"], lambda: _collect_engine("passage_cache")),
+    Gauges("chat_semantic_cache", "Semantic reply cache counters", ["stat"], lambda: _collect_engine("semantic_cache")),
+    Gauges("chat_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["upstream"], lambda: _collect_engine("circuit_state")),
+    Gauges("chat_circuit_trips", "Times each circuit breaker opened", ["upstream"], lambda: _collect_engine("circuit_trips")),
+    Gauges("chat_inference_queue", "Inference scheduler: active, queued and rejected requests", ["stat"],
+           lambda: _collect_engine("inference_queue")),
+]
+
+
+def _upstream(stage):
+    from local_index import RETRIEVAL_BACKEND
+
+    return {"encode": "embedding", "retrieve": RETRIEVAL_BACKEND, "inference": "vllm"}.get(stage, "engine")
+
+
+def observe_turn(turn):
+    profile = turn.profile
+    turns_total.inc(profile, turn.status)
+    for name, seconds in turn.stages.items():
+        stage_seconds.observe(profile, name, value=seconds)
+    if turn.ttft is not None:
+        stage_seconds.observe(profile, "ttft", value=turn.ttft)
+    stage_seconds.observe(profile, "total", value=turn.total)
+
+    if turn.usage:
+        for kind, histogram in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+            count = turn.usage.get(f"{kind}_tokens")
+            if count is not None:
+                histogram.observe(profile, value=count)
+                tokens_total.inc(profile, kind, amount=count)
+    if turn.retrieval:
+        retrieval_matches.observe(profile, value=turn.retrieval["matches"])
+        if turn.retrieval["top_score"] is not None:
+            retrieval_top_score.observe(profile, value=turn.retrieval["top_score"])
+        if not turn.retrieval["matches"]:
+            retrieval_empty_total.inc(profile)
+    if turn.retrieval_fallback:
+        retrieval_fallback_total.inc(profile, *turn.retrieval_fallback.split(":", 1))
+    if turn.packing:
+        context_tokens.observe(profile, "before", value=turn.packing["tokens_before"])
+        context_tokens.observe(profile, "after", value=turn.packing["tokens_after"])
+    if turn.topic_reset:
+        topic_resets_total.inc(profile)
+    if turn.prefix_reuse is not None:
+        prefix_reuse_ratio.observe(profile, value=turn.prefix_reuse)
+    if turn.failed_stage:
+        upstream_errors_total.inc(profile, _upstream(turn.failed_stage))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# === Per-turn trace log ===
+class TraceLog:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, turn):
+        line = json.dumps(turn.as_dict(), ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# === HTTP endpoint (/metrics, /ready) ===
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            self._send(200, render(), "text/plain; version=0.0.4")
+        elif self.path.startswith("/ready"):
+            from startup import readiness
+
+            state = readiness()
+            self._send(200 if state["ready"] else 503, json.dumps(state), "application/json")
+        else:
+            self._send(404, "not found\n", "text/plain")
+
+    def _send(self, status, body, content_type):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+_installed = False
+_install_lock = threading.Lock()
+_server = None
+
+
+def install(port=METRICS_PORT, trace_log=TRACE_LOG):
+    # Once per process: observe every turn, optionally trace it, and serve /metrics + /ready.
+    global _installed, _server
+    with _install_lock:
+        if _installed:
+            return _server
+        timing.add_listener(observe_turn)
+        if trace_log:
+            timing.add_listener(TraceLog(trace_log))
+        if port:
+            _server = ThreadingHTTPServer((METRICS_HOST, port), _Handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        _installed = True
+        return _server
@@ -0,0 +1,80 @@
+import os
+import json
+
+# === Domain profile settings (override via environment) ===
+# One JSON object per assistant; see profiles.json for the bundled helpdesk and medical profiles.
+PROFILES_FILE = os.environ.get(
+    "CHAT_PROFILES_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.json"),
+)
+
+
+# === Context formatters (referenced by name from the profile config) ===
+# Each entry turns an ES/local-index hit into a match dict, and a list of matches into context text;
+# the last item names the match field holding the retrieved text (what context packing trims).
+def _helpdesk_match(hit):
+    return {
+        "issue_id": hit["_source"]["issue_id"],
+        "answer_body": hit["_source"]["answer_body"],
+        "score": hit["_score"]
+    }
+
+
+def _helpdesk_context(matches):
+    return "\n\n---\n\n".join(match['answer_body'] for match in matches)
+
+
+def _medical_match(hit):
+    return {
+        "content": hit["_source"].get("content", ""),
+        "metadata": hit["_source"].get("metadata", {}),
+        "score": hit["_score"]
+    }
+
+
+def _medical_context(matches):
+    return "\n\n---\n\n".join(
+        f"{match['content']}\n\n(Source: {match['metadata'].get('source', 'unknown')})"
+        for match in matches
+    )
+
+
+CONTEXT_FORMATTERS = {
+    "helpdesk_issues": (_helpdesk_match, _helpdesk_context, "answer_body"),
+    "medical_chunks": (_medical_match, _medical_context, "content"),
+}
+
+
+# === Domain profile ===
+class DomainProfile:
+    # Everything that differs between assistants; the chat flow itself lives in chat_engine.py.
+    def __init__(self, name, config):
+        self.name = name
+        self.title = config.get("title", f"{name.title()} Chatbot")  # page heading in the frontends
+        self.es_host = os.environ.get(f"{name.upper()}_ES_HOST", config["es_host"])
+        self.infer_url = os.environ.get(f"{name.upper()}_INFER_URL", config["infer_url"])
+        self.index = config["index"]
+        self.cache_namespace = config.get("cache_namespace", name)
+        self.max_tokens = int(config.get("max_tokens", 512))
+        self.min_score = float(config.get("min_score", 0.4))
+
+        system_prompt = config["system_prompt"]
+        self.system_prompt = "\n".join(system_prompt) if isinstance(system_prompt, list) else system_prompt
+
+        formatter = config["context_formatter"]
+        if formatter not in CONTEXT_FORMATTERS:
+            raise ValueError(f"Unknown context_formatter {formatter!r} in profile {name!r}")
+        self.format_match, self.format_context, self.match_text_key = CONTEXT_FORMATTERS[formatter]
+        self.context_found = config["context_found"]
+        self.context_missing = config["context_missing"]
+
+        self.vague_keywords = list(config.get("vague_keywords", []))
+        self.instructions = dict(config.get("instructions", {}))
+        self.drop_stale_context = bool(config.get("drop_stale_context", False))
+        self.announce_topic_change = bool(config.get("announce_topic_change", False))
+        self.payload = dict(config.get("payload", {}))
+
+
+def load_profiles(path=PROFILES_FILE):
+    with open(path, encoding="utf-8") as f:
+        return {name: DomainProfile(name, config) for name, config in json.load(f).items()}
@@ -0,0 +1,60 @@
+import os
+from history import trim_to_budget, prompt_tokens, message_tokens
+
+# === Prompt layout settings (override via environment) ===
+# "legacy": context/instructions are appended into the history as before.
+# "stable": append-only prefix for vLLM automatic prefix caching:
+#     system prompt -> pinned context -> user/assistant turns -> volatile tail (behavior instruction)
+PROMPT_LAYOUT = os.environ.get("PROMPT_LAYOUT", "legacy")
+# When the stable layout must evict, it trims down to this fraction of the budget, so the
+# prefix then stays unchanged for several turns instead of shifting on every turn.
+EVICTION_LOW_WATER = float(os.environ.get("EVICTION_LOW_WATER", "0.6"))
+
+
+def stable_layout():
+    return PROMPT_LAYOUT == "stable"
+
+
+def is_context_message(message):
+    return "Context Update" in message.get("content", "")
+
+
+def pin_context(messages, context_message):
+    # Replace the pinned context in place (topic drift) or insert it right after the system prompt.
+    for i, msg in enumerate(messages):
+        if is_context_message(msg):
+            messages[i] = context_message
+            return
+    messages.insert(1, context_message)
+
+
+def trim_stable(messages, budget, pinned=(), tail=()):
+    budget -= sum(message_tokens(msg) for msg in tail)
+    if prompt_tokens(messages) <= budget:
+        return messages
+    return trim_to_budget(messages, int(budget * EVICTION_LOW_WATER), pinned=pinned)
+
+
+def assemble_prompt(messages, tail=()):
+    return list(messages) + [msg for msg in tail if msg]
+
+
+def measure_prefix_reuse(conv, prompt):
+    # How much of this request's prompt is byte-identical (message by message) to the previous one
+    # for this conversation, i.e. what vLLM's prefix cache can reuse.
+    reused_messages = reused_tokens = 0
+    for previous, (role, content) in zip(conv.last_prompt, ((m["role"], m["content"]) for m in prompt)):
+        if previous != (role, content):
+            break
+        reused_messages += 1
+        reused_tokens += message_tokens(prompt[reused_messages - 1])
+
+    total_tokens = prompt_tokens(prompt)
+    conv.last_prompt = [(m["role"], m["content"]) for m in prompt]
+    conv.prefix_reuse = {
+        "reused_messages": reused_messages,
+        "reused_tokens": reused_tokens,
+        "prompt_tokens": total_tokens,
+        "ratio": reused_tokens / total_tokens if total_tokens else 0.0,
+    }
+    return conv.prefix_reuse
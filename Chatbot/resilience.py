@@ -0,0 +1,151 @@
+import os
+import time
+import random
+import asyncio
+import threading
+
+# === Deadline / retry settings (override via environment) ===
+ENCODE_DEADLINE = float(os.environ.get("ENCODE_DEADLINE", "5"))            # seconds for the query embedding
+RETRIEVE_DEADLINE = float(os.environ.get("RETRIEVE_DEADLINE", "2"))        # whole search incl. retries
+RETRIEVE_RETRIES = int(os.environ.get("RETRIEVE_RETRIES", "2"))
+RETRIEVE_HEDGE_MS = float(os.environ.get("RETRIEVE_HEDGE_MS", "0"))        # 0 = no hedged second search
+RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", "0.05"))
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", "0.5"))
+INFER_DEADLINE = float(os.environ.get("INFER_DEADLINE", "120"))            # non-streaming completion
+INFER_FIRST_TOKEN_DEADLINE = float(os.environ.get("INFER_FIRST_TOKEN_DEADLINE", "30"))
+
+# === Circuit breaker settings ===
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))            # consecutive failures to open
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))  # open -> half-open probe
+LOCAL_FALLBACK = os.environ.get("LOCAL_FALLBACK", "1") == "1"              # use a local index while ES is down
+
+
+def backoff_delay(attempt, base=RETRY_BACKOFF_BASE, cap=RETRY_BACKOFF_MAX):
+    # "Full jitter": uniform in [0, min(cap, base * 2^attempt)] so retries from many sessions spread out
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def hedged(attempt, timeout, hedge_after):
+    # Starts a second identical attempt if the first is still running after `hedge_after` seconds;
+    # the first success wins and the other attempt is cancelled.
+    if hedge_after <= 0 or hedge_after >= timeout:
+        return await attempt(timeout)
+    tasks = {asyncio.ensure_future(attempt(timeout))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.add(asyncio.ensure_future(attempt(timeout - hedge_after)))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_retries(attempt, deadline, retries=RETRIEVE_RETRIES, hedge_after=0.0):
+    # `attempt(timeout)` must be idempotent. Retries with jittered backoff until it succeeds,
+    # retries run out, or the overall deadline would be exceeded.
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    for attempt_number in range(retries + 1):
+        remaining = end - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        try:
+            return await asyncio.wait_for(hedged(attempt, remaining, hedge_after), remaining)
+        except asyncio.TimeoutError:
+            raise
+        except Exception:
+            delay = backoff_delay(attempt_number)
+            if attempt_number == retries or loop.time() + delay >= end:
+                raise
+            await asyncio.sleep(delay)
+
+
+async def first_item_deadline(async_iter, timeout):
+    # Bounds the wait for the first item (time to first token); later gaps are bounded by the
+    # transport's socket read timeout
+    iterator = async_iter.__aiter__()
+    try:
+        try:
+            first = await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        yield first
+        async for item in iterator:
+            yield item
+    finally:
+        await iterator.aclose()
+
+
+# === Circuit breaker ===
+class CircuitBreaker:
+    # closed -> (N consecutive failures) -> open -> (reset timeout) -> half-open: one probe request
+    # decides between closed and open again.
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_started = None  # a half-open probe in flight (a cancelled probe expires after reset_timeout)
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_started = None
+            if self.state == "half_open" and (self._probe_started is None or now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                    print(f"⚠️ Circuit {self.name} open after {self.failures} failure(s); retrying in {self.reset_timeout:.0f}s")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe_started = None
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "trips": self.trips}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breaker_stats():
+    with _breakers_lock:
+        return {name: breaker.stats() for name, breaker in _breakers.items()}
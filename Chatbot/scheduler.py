@@ -0,0 +1,128 @@
+import os
+import heapq
+import asyncio
+import itertools
+import weakref
+from contextlib import asynccontextmanager
+
+# === Inference admission settings (override via environment) ===
+INFER_MAX_CONCURRENCY = int(os.environ.get("INFER_MAX_CONCURRENCY", "16"))  # in-flight generations; 0 = no scheduler
+INFER_MAX_QUEUE = int(os.environ.get("INFER_MAX_QUEUE", "64"))              # waiting requests before "busy"
+INFER_QUEUE_TIMEOUT = float(os.environ.get("INFER_QUEUE_TIMEOUT", "15"))     # seconds a request may wait for a slot
+SHORT_PROMPT_TOKENS = int(os.environ.get("SHORT_PROMPT_TOKENS", "1024"))
+PRIORITY_BOOST = float(os.environ.get("PRIORITY_BOOST", "2"))               # head start (s) for first turns / short prompts
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason  # "queue_full" or "queue_timeout"
+
+
+class InferenceScheduler:
+    # Client-side gate in front of vLLM, used on one event loop:
+    # - at most `max_concurrency` generations in flight (one per conversation is enforced earlier,
+    #   by ChatEngine.conversation_turn, before the prompt is built),
+    # - waiting requests ordered by arrival time minus a boost for first turns and short prompts
+    #   (so long prompts are delayed by at most PRIORITY_BOOST seconds, never starved),
+    # - backpressure: a full queue or a long wait fails fast with SchedulerBusy.
+    def __init__(self, max_concurrency=INFER_MAX_CONCURRENCY, max_queue=INFER_MAX_QUEUE,
+                 queue_timeout=INFER_QUEUE_TIMEOUT, short_prompt_tokens=SHORT_PROMPT_TOKENS,
+                 priority_boost=PRIORITY_BOOST):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.short_prompt_tokens = short_prompt_tokens
+        self.priority_boost = priority_boost
+        self.active = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self._waiting = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+
+    @property
+    def queued(self):
+        return len(self._waiting)
+
+    def admit(self):
+        # Fast backpressure check; callers run it before doing any per-turn work
+        if self.max_concurrency and self.queued >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise SchedulerBusy("queue_full")
+
+    def priority(self, prompt_tokens, first_turn):
+        favored = first_turn or prompt_tokens <= self.short_prompt_tokens
+        return asyncio.get_running_loop().time() - (self.priority_boost if favored else 0.0)
+
+    @asynccontextmanager
+    async def slot(self, prompt_tokens=0, first_turn=False):
+        if not self.max_concurrency:
+            yield
+            return
+        await self._acquire(prompt_tokens, first_turn)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, prompt_tokens, first_turn):
+        self.admit()
+        future = asyncio.get_running_loop().create_future()
+        entry = [self.priority(prompt_tokens, first_turn), next(self._seq), future]
+        heapq.heappush(self._waiting, entry)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self._release()  # granted just as the wait timed out: hand it back
+            else:
+                self._forget(entry)
+            self.rejected["queue_timeout"] += 1
+            raise SchedulerBusy("queue_timeout") from None
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self._release()  # cancelled just after the slot was granted: hand it back
+            else:
+                self._forget(entry)
+            raise
+
+    def _forget(self, entry):
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiting and self.active < self.max_concurrency:
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue  # cancelled (timeout or task cancellation) before its task ran _forget
+            self.active += 1
+            future.set_result(None)
+
+    def stats(self):
+        return {"active": self.active, "queued": self.queued, **{f"rejected_{k}": v for k, v in self.rejected.items()}}
+
+
+# One scheduler per event loop (the engine's background loop in practice)
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_scheduler():
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = InferenceScheduler()
+    return scheduler
+
+
+def scheduler_stats():
+    # Summed over loops; read from the metrics thread without touching the queues
+    totals = {}
+    for scheduler in list(_schedulers.values()):
+        for key, value in scheduler.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
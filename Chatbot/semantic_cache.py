@@ -0,0 +1,103 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# === Semantic response cache settings (override via environment) ===
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+
+class _Namespace:
+    def __init__(self):
+        self.entries = OrderedDict()  # key -> (embedding, reply, created)
+        self.matrix = None            # stacked embeddings, rebuilt lazily after changes
+        self.keys = []
+        self.next_key = 0
+
+
+# === First-turn reply cache keyed by query embedding ===
+class SemanticCache:
+    # A first-turn prompt depends only on the query (system prompt + retrieved context +
+    # behavior instruction), so a near-identical first question can reuse the stored reply.
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, enabled=SEMANTIC_CACHE_ENABLED):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, namespace, embedding):
+        if not self.enabled:
+            return None
+        query = _unit(embedding)
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is not None:
+                self._expire(ns)
+            if ns is None or not ns.entries:
+                self.misses += 1
+                return None
+            if ns.matrix is None:
+                ns.keys = list(ns.entries)
+                ns.matrix = np.vstack([ns.entries[key][0] for key in ns.keys])
+            similarities = ns.matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = ns.keys[best]
+            ns.entries.move_to_end(key)
+            self.hits += 1
+            return ns.entries[key][1]
+
+    def store(self, namespace, embedding, reply):
+        if not self.enabled:
+            return
+        with self._lock:
+            ns = self._namespaces.setdefault(namespace, _Namespace())
+            ns.entries[ns.next_key] = (_unit(embedding), reply, time.monotonic())
+            ns.next_key += 1
+            while len(ns.entries) > self.max_entries:
+                ns.entries.popitem(last=False)
+            ns.matrix = None
+
+    def clear(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                self._namespaces.clear()
+            else:
+                self._namespaces.pop(namespace, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": {name: len(ns.entries) for name, ns in self._namespaces.items()},
+            }
+
+    def _expire(self, ns):
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, (_, _, created) in ns.entries.items() if created < cutoff]
+        for key in expired:
+            del ns.entries[key]
+        if expired:
+            ns.matrix = None
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+# Shared by both assistants; each uses its own namespace
+response_cache = SemanticCache()
@@ -0,0 +1,35 @@
+import sys
+import argparse
+
+# Container entry point: installs metrics and starts the warm-up, then runs the Streamlit app in
+# the same process.
+# `streamlit run` only executes the app script when a browser session opens, so a pod started
+# that way never warms up (and never touches READY_FILE) until it gets traffic, which a
+# not-yet-Ready pod never does.
+# Usage:
+#   python serve.py test_streamlit.py --profiles helpdesk -- --server.port=8501 --server.address=0.0.0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm up the chat engine and serve a Streamlit frontend.")
+    parser.add_argument("script", help="Streamlit app, e.g. test_streamlit.py")
+    parser.add_argument("--profiles", nargs="*", help="Profiles to warm up (default: WARM_UP_PROFILES, else all)")
+    # Anything else (e.g. --server.port=8501) is passed to `streamlit run`
+    args, streamlit_args = parser.parse_known_args(argv)
+    streamlit_args = [arg for arg in streamlit_args if arg != "--"]
+
+    # Imported as `startup` (not run as __main__), so the app script shares its warm-up state
+    import metrics
+    from startup import start_warm_up
+
+    metrics.install()  # /metrics, /ready and TRACE_LOG from process start, before any session or warm-up
+    start_warm_up(args.profiles or None)
+
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", args.script, *streamlit_args]
+    return cli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
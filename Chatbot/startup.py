@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# === Startup settings (override via environment) ===
+# READY_FILE is touched once the model is warm, for an exec readiness probe (`test -f $READY_FILE`).
+READY_FILE = os.environ.get("READY_FILE", "/tmp/chatbot-ready")
+# Profiles to warm up; empty = every profile in profiles.json
+WARM_UP_PROFILES = [name for name in os.environ.get("WARM_UP_PROFILES", "").split(",") if name]
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "0") == "1"  # print stage timings after warm-up
+
+_process_start = time.monotonic()
+_stages = []
+_ready = threading.Event()
+_error = None
+_thread = None
+_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stages.append((name, time.perf_counter() - start))
+
+
+# === Warm-up ===
+def warm_up(profile_names=None):
+    # Loads everything the first request would otherwise pay for. Safe to call more than once.
+    global _error
+    if not _ready.is_set() and READY_FILE and os.path.exists(READY_FILE):
+        os.remove(READY_FILE)  # left over from a previous process in this container
+    import metrics
+
+    metrics.install()  # /metrics and /ready are served while warm-up runs
+    try:
+        with stage("import chat engine"):
+            import chat_engine
+            import transport
+            from history import count_tokens
+            from local_index import RETRIEVAL_BACKEND, get_local_index
+
+        with stage("load profiles"):
+            names = profile_names or WARM_UP_PROFILES or sorted(chat_engine.get_profiles())
+            engines = [chat_engine.get_engine(name) for name in names]
+
+        with stage("load embedding model"):
+            batcher, _ = chat_engine.get_embedder()
+
+        with stage("first encode"):
+            batcher.encode("warm up")  # first forward pass + batching worker, bypassing the query cache
+
+        with stage("load tokenizer"):
+            count_tokens("warm up")
+
+        with stage("start event loop"):
+            transport.get_background_loop()
+
+        # The serving pipeline's clients live on the background loop, so they are created there
+        with stage("create inference session"):
+            transport.run_sync(_create_inference_session())
+
+        if RETRIEVAL_BACKEND == "local":
+            with stage("map local indexes"):
+                for engine in engines:
+                    get_local_index(engine.profile.index)
+        else:
+            with stage("connect to elasticsearch"):
+                transport.run_sync(_connect_elasticsearch(sorted({engine.profile.es_host for engine in engines})))
+    except Exception as e:
+        _error = f"{type(e).__name__}: {e}"
+        raise
+
+    _error = None
+    if READY_FILE:
+        with open(READY_FILE, "w", encoding="utf-8") as f:
+            f.write(f"{time.monotonic() - _process_start:.2f}\n")
+    _ready.set()
+    if STARTUP_PROFILE:
+        print_profile()
+
+
+async def _create_inference_session():
+    import transport
+
+    transport.get_aiohttp_session()
+
+
+async def _connect_elasticsearch(hosts):
+    # Opens a pooled connection per cluster; an unreachable cluster is reported, not fatal
+    # (retrieval falls back while the circuit breaker is open)
+    import transport
+
+    for host in hosts:
+        if not await transport.get_async_es_client(host).ping():
+            print(f"⚠️ Elasticsearch at {host} did not answer the warm-up ping", file=sys.stderr)
+
+
+def start_warm_up(profile_names=None):
+    # Background warm-up (once per process): the UI can render while the model loads.
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm_up_quietly, args=(profile_names,), name="warm-up", daemon=True)
+            _thread.start()
+    return _thread
+
+
+def _warm_up_quietly(profile_names):
+    try:
+        warm_up(profile_names)
+    except Exception:
+        print(f"⚠️ Warm-up failed: {_error}", file=sys.stderr)
+
+
+# === Readiness ===
+def is_ready():
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout=None):
+    return _ready.wait(timeout)
+
+
+def readiness():
+    return {
+        "ready": is_ready(),
+        "error": _error,
+        "uptime_s": round(time.monotonic() - _process_start, 2),
+        "stages": {name: round(seconds, 3) for name, seconds in _stages},
+    }
+
+
+def print_profile(file=sys.stderr):
+    total = sum(seconds for _, seconds in _stages)
+    print("⏱️ Startup profile:", file=file)
+    for name, seconds in _stages:
+        print(f"  {name:<30} {seconds * 1000:>9.1f} ms", file=file)
+    print(f"  {'total':<30} {total * 1000:>9.1f} ms", file=file)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Warm up the chat engine and print a startup profile.")
+    parser.add_argument("profiles", nargs="*", help="Profiles to warm up (default: all)")
+    parser.add_argument("--check", action="store_true", help="Exit 0 if READY_FILE exists (readiness probe)")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if READY_FILE and os.path.exists(READY_FILE) else 1)
+    warm_up(args.profiles)
+    print_profile(sys.stdout)
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl  # cross-process save lock (POSIX); without it saves are only serialized within the process
+except ImportError:
+    fcntl = None
+
+# === Conversation state store settings (override via environment) ===
+# "memory" keeps conversations in the process only; "sqlite" / "file" persist them so a restarted
+# or different replica can continue any conversation.
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "memory")
+CONVERSATION_STORE_PATH = os.environ.get(
+    "CONVERSATION_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations")
+)
+
+
+def encode_embedding(embedding):
+    return None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def decode_embedding(blob):
+    return None if blob is None else np.frombuffer(blob, dtype=np.float32)
+
+
+# Store interface (namespace = profile, so assistants sharing a store never see each other's sessions):
+#   version(namespace, session_id) -> int | None     cheap freshness check
+#   load(namespace, session_id) -> (state, messages, version, transcript) | None
+#   save(namespace, session_id, state, messages, keep, expected_version, transcript, transcript_keep) -> new version
+#       `keep` leading messages are already stored unchanged; only the rest is written
+#       (likewise `transcript_keep` for the transcript, the untrimmed turns shown on reload)
+#   delete(namespace, session_id)
+# `state` holds the topic embedding as float32 bytes plus the clarification counters.
+
+
+# === SQLite store (one row per conversation, one row per message) ===
+class SQLiteStateStore:
+    def __init__(self, path):
+        if os.path.isdir(path) or not os.path.splitext(path)[1]:
+            os.makedirs(path, exist_ok=True)
+            path = os.path.join(path, "conversations.sqlite3")
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")    # readers don't block the writer (several processes)
+        self._db.execute("PRAGMA synchronous=NORMAL")  # one fsync per checkpoint, not per turn
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                namespace TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                topic_embedding BLOB,
+                context_injected INTEGER NOT NULL,
+                guiding_questions_done INTEGER NOT NULL,
+                clarification_rounds INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, session_id)
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                namespace TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (namespace, session_id, position)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS transcript (
+                namespace TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (namespace, session_id, position)
+            ) WITHOUT ROWID;
+        """)
+
+    def version(self, namespace, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version FROM conversations WHERE namespace = ? AND session_id = ?", (namespace, session_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, namespace, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, topic_embedding, context_injected, guiding_questions_done, clarification_rounds "
+                "FROM conversations WHERE namespace = ? AND session_id = ?", (namespace, session_id)
+            ).fetchone()
+            if row is None:
+                return None
+            messages, transcript = (
+                [{"role": role, "content": content} for role, content in self._db.execute(
+                    f"SELECT role, content FROM {table} WHERE namespace = ? AND session_id = ? ORDER BY position",
+                    (namespace, session_id),
+                )]
+                for table in ("messages", "transcript")
+            )
+        state = {
+            "topic_embedding": row[1],
+            "context_injected": bool(row[2]),
+            "guiding_questions_done": bool(row[3]),
+            "clarification_rounds": row[4],
+        }
+        return state, messages, row[0], transcript
+
+    def _write_rows(self, table, key, rows, keep):
+        self._db.execute(f"DELETE FROM {table} WHERE namespace = ? AND session_id = ? AND position >= ?", key + (keep,))
+        self._db.executemany(
+            f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?)",
+            [key + (position, msg["role"], msg["content"]) for position, msg in enumerate(rows[keep:], keep)],
+        )
+
+    def save(self, namespace, session_id, state, messages, keep=0, expected_version=None,
+             transcript=(), transcript_keep=0):
+        key = (namespace, session_id)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT version FROM conversations WHERE namespace = ? AND session_id = ?", key
+                ).fetchone()
+                current = row[0] if row else None
+                if current != expected_version:
+                    keep = transcript_keep = 0  # someone else wrote this conversation since we loaded it: rewrite it all
+                self._write_rows("messages", key, messages, keep)
+                self._write_rows("transcript", key, list(transcript), transcript_keep)
+                version = (current or 0) + 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    key + (version, state["topic_embedding"], int(state["context_injected"]),
+                           int(state["guiding_questions_done"]), state["clarification_rounds"], time.time()),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return version
+
+    def delete(self, namespace, session_id):
+        key = (namespace, session_id)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM messages WHERE namespace = ? AND session_id = ?", key)
+            self._db.execute("DELETE FROM transcript WHERE namespace = ? AND session_id = ?", key)
+            self._db.execute("DELETE FROM conversations WHERE namespace = ? AND session_id = ?", key)
+            self._db.execute("COMMIT")
+
+
+# === File store (one JSON file per conversation, replaced atomically) ===
+class FileStateStore:
+    # Conversations are token-budgeted and transcripts capped, so rewriting one small file per turn
+    # is cheap; `keep` / `transcript_keep` are unused.
+    # The record carries an integer version: file mtimes are too coarse on NFS and some volume
+    # mounts to tell two quick writes apart. The version is also kept in a small sidecar file
+    # (<record>.version) so the per-turn freshness check doesn't parse the whole record.
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, namespace, session_id):
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()  # session ids are not filename-safe
+        return os.path.join(self.root, namespace, digest + ".json")
+
+    def _read(self, namespace, session_id):
+        try:
+            with open(self._path(namespace, session_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _locked(self, path):
+        # Serializes read-increment-write of one conversation across threads and processes
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _replace(path, text):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def version(self, namespace, session_id):
+        path = self._path(namespace, session_id)
+        try:
+            with open(path + ".version", encoding="ascii") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            if not os.path.exists(path):
+                return None
+            record = self._read(namespace, session_id)  # written before sidecars existed
+            return None if record is None else record.get("version", 0)
+
+    def load(self, namespace, session_id):
+        record = self._read(namespace, session_id)
+        if record is None:
+            return None
+        state = dict(record["state"])
+        if state["topic_embedding"] is not None:
+            state["topic_embedding"] = base64.b64decode(state["topic_embedding"])
+        return state, record["messages"], record.get("version", 0), record.get("transcript", [])
+
+    def save(self, namespace, session_id, state, messages, keep=0, expected_version=None,
+             transcript=(), transcript_keep=0):
+        path = self._path(namespace, session_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        state = dict(state)
+        if state["topic_embedding"] is not None:
+            state["topic_embedding"] = base64.b64encode(state["topic_embedding"]).decode("ascii")
+        with self._locked(path):
+            current = self.version(namespace, session_id)
+            # A mismatch with expected_version means another writer got here first; the whole record is
+            # rewritten either way, and the new version makes every other cached copy stale
+            version = (current or 0) + 1
+            record = {"session_id": session_id, "version": version, "state": state, "updated_at": time.time(),
+                      "messages": [{"role": msg["role"], "content": msg["content"]} for msg in messages],
+                      "transcript": [{"role": msg["role"], "content": msg["content"]} for msg in transcript]}
+            # Sidecar first: a reader that sees the new version but loads the old record keeps the old
+            # version, so its next freshness check reloads
+            self._replace(path + ".version", str(version))
+            self._replace(path, json.dumps(record, ensure_ascii=False))
+        return version
+
+    def delete(self, namespace, session_id):
+        path = self._path(namespace, session_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._locked(path):
+            for stale in (path, path + ".version"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+
+STORES = {"sqlite": SQLiteStateStore, "file": FileStateStore}
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_state_store(kind=CONVERSATION_STORE, path=CONVERSATION_STORE_PATH):
+    # None for the in-memory default; otherwise one shared store per (kind, path)
+    if kind == "memory":
+        return None
+    if kind not in STORES:
+        raise ValueError(f"Unknown CONVERSATION_STORE {kind!r}; expected memory, {', '.join(sorted(STORES))}")
+    with _stores_lock:
+        store = _stores.get((kind, path))
+        if store is None:
+            store = _stores[(kind, path)] = STORES[kind](path)
+        return store
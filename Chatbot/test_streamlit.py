@@ -1,6 +1,14 @@
+import os
+import uuid
 import streamlit as st
-import time
-from backend_chatbot import send_message, reset_conversation  # 🧠 your local backend functions
+from itertools import chain
+from startup import start_warm_up, is_ready
+
+# --- Only the latest messages are drawn as chat bubbles; earlier ones stay collapsed (0 = draw all)
+HISTORY_WINDOW = int(os.environ.get("CHAT_HISTORY_WINDOW", "20"))
+# --- Keep the conversation id in the URL so a reload resumes it. Anyone holding the link can read the
+#     stored transcript, so this is off by default for medical chats (see CONVERSATION_STORE in the Readme)
+RESUME_FROM_URL = os.environ.get("RESUME_FROM_URL", "1") == "1"
 
 # --- Hide Streamlit default elements
 hide_streamlit_style = """
@@ -27,17 +35,52 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# --- Initialize conversation
+
+# --- Backend resources (engine, embedding model, connection pools) are built once per process, not per rerun
+@st.cache_resource(show_spinner=False)
+def load_backend():
+    import backend_chatbot  # 🧠 your local backend functions
+
+    start_warm_up(["helpdesk"])  # loads the embedding model in the background while the page renders
+    return backend_chatbot
+
+
+backend = load_backend()
+
+# --- Backend conversation id: in the URL, a reload (on any replica) resumes the conversation;
+#     otherwise it lives in the server-side session only and a reload starts a fresh one
+if RESUME_FROM_URL:
+    if "conversation" not in st.query_params:
+        st.query_params["conversation"] = uuid.uuid4().hex  # 🔄 New id = fresh backend context
+    session_id = st.query_params["conversation"]
+else:
+    if "conversation" not in st.session_state:
+        st.session_state.conversation = uuid.uuid4().hex
+    session_id = st.session_state.conversation
+
+# --- Initialize conversation (replaying any turns the conversation store already has)
 if "messages" not in st.session_state:
     st.session_state.messages = [
         {"role": "assistant", "content": "👋 Hi there! How may I help you today?"}
-    ]
-    reset_conversation()  # 🔄 Clear any past context in the backend
+    ] + backend.get_transcript(session_id)
+
+
+def render_earlier(messages):
+    # One markdown element for the whole collapsed part instead of a chat bubble per message
+    return "\n\n---\n\n".join(
+        f"**{'You' if msg['role'] == 'user' else 'Assistant'}:** {msg['content']}" for msg in messages
+    )
+
 
-# --- Display chat history
+# --- Display chat history: every rerun redraws it, so only a window of it is sent to the browser
+messages = st.session_state.messages
+hidden = len(messages) - HISTORY_WINDOW if HISTORY_WINDOW and len(messages) > HISTORY_WINDOW else 0
 chat_container = st.container()
 with chat_container:
-    for msg in st.session_state.messages:
+    if hidden and st.toggle("Show earlier messages", key="show_earlier", help=f"{hidden} earlier messages"):
+        with st.container(border=True):
+            st.markdown(render_earlier(messages[:hidden]))
+    for msg in messages[hidden:]:
         avatar = USER_AVATAR if msg["role"] == "user" else ASSISTANT_AVATAR
         with st.chat_message(msg["role"], avatar=avatar):
             st.markdown(msg["content"])
@@ -56,21 +99,14 @@ if prompt:
     # Call backend locally via function
     with chat_container:
         with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
-            with st.spinner("Thinking..."):
-                try:
-                    raw_response = send_message(prompt)
-                    response_text = str(raw_response)
-
-                    # Typing effect
-                    placeholder = st.empty()
-                    typed_text = ""
-                    for char in response_text:
-                        typed_text += char
-                        placeholder.markdown(typed_text + "▍")
-                        time.sleep(0.015)
-
-                    placeholder.markdown(typed_text)
-                    st.session_state.messages.append({"role": "assistant", "content": typed_text})
-                except Exception as e:
-                    st.error(f"Error calling backend: {e}")
+            try:
+                # Spinner covers retrieval + time-to-first-token, then tokens render as they arrive
+                stream = backend.send_message_stream(prompt, session_id)
+                with st.spinner("Thinking..." if is_ready() else "Loading the assistant..."):
+                    first_chunk = next(stream, "")
+                # One element, updated in place as tokens arrive
+                response_text = st.write_stream(chain([first_chunk], stream))
+                st.session_state.messages.append({"role": "assistant", "content": response_text})
+            except Exception as e:
+                st.error(f"Error calling backend: {e}")
 
@@ -0,0 +1,111 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# === Per-turn stage timings ===
+# A turn is one user message through the pipeline. Stages record into the turn bound to the
+# current context, so tasks spawned by the turn (e.g. hedged searches) record into it too.
+STAGES = ("encode", "retrieve", "pack", "prompt", "queue", "inference")
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+class Turn:
+    def __init__(self, profile, stream=False):
+        self.profile = profile
+        self.stream = stream
+        self.stages = {}
+        self.status = "ok"
+        self.ttft = None  # seconds to the first streamed token
+        self.total = None
+        self.usage = {}            # prompt_tokens / completion_tokens reported by vLLM
+        self.retrieval = None      # {"hits", "matches", "top_score"} of the search used for context
+        self.retrieval_fallback = None  # "<local|none>:<reason>" when ES was skipped or failed
+        self.packing = None        # passages / tokens before and after context packing
+        self.topic_reset = False
+        self.prefix_reuse = None   # share of prompt tokens identical to the previous request
+        self.failed_stage = None   # stage whose upstream failed ("encode", "retrieve", "inference", ...)
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def as_dict(self):
+        return {
+            "started_at": self.started_at,
+            "profile": self.profile,
+            "stream": self.stream,
+            "status": self.status,
+            "total": self.total,
+            "ttft": self.ttft,
+            "stages": dict(self.stages),
+            "usage": dict(self.usage),
+            "retrieval": self.retrieval,
+            "retrieval_fallback": self.retrieval_fallback,
+            "packing": self.packing,
+            "topic_reset": self.topic_reset,
+            "prefix_reuse": self.prefix_reuse,
+            "failed_stage": self.failed_stage,
+        }
+
+
+def begin_turn(profile, stream=False):
+    turn = Turn(profile, stream)
+    _current_turn.set(turn)
+    return turn
+
+
+def current_turn():
+    return _current_turn.get()
+
+
+def annotate(**fields):
+    # Sets attributes on the current turn, if any (no-op outside a turn, e.g. sync callers)
+    turn = _current_turn.get()
+    if turn is not None:
+        for name, value in fields.items():
+            setattr(turn, name, value)
+
+
+def end_turn(turn, status=None):
+    if status is not None:
+        turn.status = status
+    turn.total = turn.elapsed()
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(turn)
+
+
+@contextmanager
+def stage(name):
+    # Only completed stages are recorded; a cancelled hedged search adds nothing.
+    start = time.perf_counter()
+    turn = _current_turn.get()
+    try:
+        yield
+    except Exception:
+        if turn is not None and turn.failed_stage is None:
+            turn.failed_stage = name
+        raise
+    if turn is not None:
+        turn.add(name, time.perf_counter() - start)
+
+
+# === Listeners (benchmarks, metrics) ===
+def add_listener(listener):
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
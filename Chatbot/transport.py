@@ -0,0 +1,230 @@
+import os
+import json
+import socket
+import asyncio
+import weakref
+import threading
+
+# elasticsearch / aiohttp are imported on first use, so importing this module
+# (and the backends) stays cheap on a cold start.
+
+# === Transport settings (override via environment) ===
+ES_CONNECTIONS_PER_NODE = int(os.environ.get("ES_CONNECTIONS_PER_NODE", "10"))
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", "10"))
+ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", "2"))
+
+INFER_POOL_MAXSIZE = int(os.environ.get("INFER_POOL_MAXSIZE", "32"))
+INFER_CONNECT_TIMEOUT = float(os.environ.get("INFER_CONNECT_TIMEOUT", "5"))
+INFER_READ_TIMEOUT = float(os.environ.get("INFER_READ_TIMEOUT", "120"))
+
+INFER_KEEPALIVE_TIMEOUT = float(os.environ.get("INFER_KEEPALIVE_TIMEOUT", "60"))
+
+# TCP keep-alive keeps idle pooled sockets from being silently dropped by
+# load balancers between turns.
+TCP_KEEPALIVE = os.environ.get("TCP_KEEPALIVE", "1") == "1"
+TCP_KEEPALIVE_IDLE = int(os.environ.get("TCP_KEEPALIVE_IDLE", "60"))
+
+# === Shared clients ===
+_lock = threading.Lock()
+_es_clients = {}
+# Async clients are bound to the event loop that created them
+_async_es_clients = weakref.WeakKeyDictionary()
+_aiohttp_sessions = weakref.WeakKeyDictionary()
+_background_loop = None
+
+
+def _keepalive_socket_options():
+    options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+    if TCP_KEEPALIVE:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPALIVE_IDLE))
+    return options
+
+
+def _keepalive_socket(addr_info):
+    # aiohttp socket_factory: every pooled connection gets the keep-alive options
+    family, type_, proto, _, _ = addr_info
+    sock = socket.socket(family=family, type=type_, proto=proto)
+    for level, option, value in _keepalive_socket_options():
+        sock.setsockopt(level, option, value)
+    return sock
+
+
+def _keepalive_connector(**kwargs):
+    import aiohttp
+
+    return aiohttp.TCPConnector(keepalive_timeout=INFER_KEEPALIVE_TIMEOUT, socket_factory=_keepalive_socket, **kwargs)
+
+
+def _es_client_options():
+    return dict(
+        basic_auth=(os.environ.get("elastic_user"), os.environ.get("elastic_password")),
+        verify_certs=False,
+        connections_per_node=ES_CONNECTIONS_PER_NODE,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=True,
+    )
+
+
+def get_es_client(host):
+    # One long-lived client per cluster; the client pools and reuses its TLS connections.
+    client = _es_clients.get(host)
+    if client is not None:
+        return client
+    with _lock:
+        client = _es_clients.get(host)
+        if client is None:
+            from elasticsearch import Elasticsearch
+
+            client = Elasticsearch(hosts=[host], **_es_client_options())
+            _es_clients[host] = client
+    return client
+
+
+def _sse_event(line):
+    # vLLM streams OpenAI-style SSE lines ("data: {...}") and ends with "data: [DONE]".
+    # Returns None at the end of the stream, {} for non-data lines, otherwise the parsed chunk.
+    if not line or not line.startswith("data:"):
+        return {}
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    return json.loads(data)
+
+
+def _chunk_deltas(chunk):
+    deltas = []
+    for choice in chunk.get("choices") or []:
+        content = choice.get("delta", {}).get("content")
+        if content:
+            deltas.append(content)
+    return deltas
+
+
+# === Async clients (one set per event loop) ===
+class InferenceError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"{status}: {body}")
+        self.status = status
+        self.body = body
+
+
+def _keepalive_es_node_class():
+    from elastic_transport import AiohttpHttpNode
+
+    class _KeepAliveAiohttpNode(AiohttpHttpNode):
+        # The stock node builds its own connector; this one is the same but with the keep-alive options
+        def _create_aiohttp_session(self):
+            import aiohttp
+
+            if self._loop is None:
+                self._loop = asyncio.get_running_loop()
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                skip_auto_headers=("accept", "accept-encoding", "user-agent"),
+                auto_decompress=True,
+                loop=self._loop,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                connector=_keepalive_connector(
+                    limit_per_host=self._connections_per_node,
+                    ssl=self._ssl_context or False,
+                ),
+            )
+
+    return _KeepAliveAiohttpNode
+
+
+def get_async_es_client(host):
+    clients = _async_es_clients.setdefault(asyncio.get_running_loop(), {})
+    if host not in clients:
+        from elasticsearch import AsyncElasticsearch
+
+        clients[host] = AsyncElasticsearch(hosts=[host], node_class=_keepalive_es_node_class(), **_es_client_options())
+    return clients[host]
+
+
+def get_aiohttp_session():
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    session = _aiohttp_sessions.get(loop)
+    if session is None or session.closed:
+        connector = _keepalive_connector(limit=INFER_POOL_MAXSIZE)
+        timeout = aiohttp.ClientTimeout(sock_connect=INFER_CONNECT_TIMEOUT, sock_read=INFER_READ_TIMEOUT)
+        session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _aiohttp_sessions[loop] = session
+    return session
+
+
+async def post_chat_completion_async(infer_url, payload):
+    # Returns (status, parsed JSON body on 200 / raw text otherwise)
+    async with get_aiohttp_session().post(infer_url, json=payload) as response:
+        if response.status == 200:
+            return response.status, await response.json(content_type=None)
+        return response.status, await response.text()
+
+
+async def stream_chat_completion_async(infer_url, payload, usage=None):
+    # With "stream_options": {"include_usage": true} vLLM sends token usage in a final chunk;
+    # it is copied into `usage` when a dict is passed.
+    async with get_aiohttp_session().post(infer_url, json=payload) as response:
+        if response.status != 200:
+            raise InferenceError(response.status, await response.text())
+        async for raw_line in response.content:
+            chunk = _sse_event(raw_line.decode("utf-8").strip())
+            if chunk is None:
+                break
+            if usage is not None and chunk.get("usage"):
+                usage.update(chunk["usage"])
+            for delta in _chunk_deltas(chunk):
+                yield delta
+
+
+# === Background event loop for the sync API ===
+def get_background_loop():
+    # Sync callers (Streamlit script threads) share one long-lived loop, so async clients
+    # and their connection pools survive across turns.
+    global _background_loop
+    if _background_loop is not None:
+        return _background_loop
+    with _lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="chat-event-loop", daemon=True).start()
+            _background_loop = loop
+    return _background_loop
+
+
+def run_sync(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+
+def iterate_sync(async_iterator):
+    loop = get_background_loop()
+    try:
+        while True:
+            try:
+                item = asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        asyncio.run_coroutine_threadsafe(async_iterator.aclose(), loop).result()
+
+
+def close_clients():
+    with _lock:
+        for client in _es_clients.values():
+            client.close()
+        _es_clients.clear()
+
+
+async def close_async_clients():
+    loop = asyncio.get_running_loop()
+    for client in _async_es_clients.pop(loop, {}).values():
+        await client.close()
+    session = _aiohttp_sessions.pop(loop, None)
+    if session is not None:
+        await session.close()